@@ -4,12 +4,12 @@ import sys
 if '/'.join(sys.argv[0].split('/')[:-1:]):
     os.chdir('/'.join(sys.argv[0].split('/')[:-1:]))
 
-import time
 import util
 import cli_server
+import admin_http
 
 from constants import *
-from datetime import datetime
+from scheduler import Scheduler
 from crash_logging import crash_logging
 from chat_processing import process_chats
 
@@ -19,46 +19,45 @@ __author__ = "Yegor Yershov"
 
 
 def main():
-    first_iteration = True
+    scheduler = Scheduler()
+    objects = list(OBJECTS)
+    for obj in objects:
+        scheduler.add(obj)
 
-    cli = cli_server.CLIThread(objects=list(OBJECTS))
+    cli = cli_server.CLIThread(objects=objects, scheduler=scheduler)
     cli.start()
 
+    if ADMIN_HTTP_PORT:
+        admin = admin_http.AdminHTTPThread(cli)
+        admin.start()
+
     while True:
         try:
-            if cli.objects:
-                res, debug_log = process_chats(cli.objects, first_iteration, util.debug)
-                cli.debug_log += debug_log
-
-                labels = [obj['LABEL'] for obj in cli.objects]
-                for i in range(len(res)):
-                    if res[i]['LABEL'] in labels:
-                        cli.objects[i] = res[i]
+            # wakes up at the earliest fire time or every SCHEDULER_MAX_SLEEP seconds
+            due = scheduler.wait_due(SCHEDULER_MAX_SLEEP)
+            res, debug_log = process_chats(cli.objects, due, cli.indexes, util.debug)
+            cli.debug_log += debug_log
         except Exception:
             crash_logging()
 
-        now = datetime.now()
-        first_iteration = False
-        #print(abs((now.replace(minute=(now.minute+1)%60, second=0) - now).total_seconds())%61 + 1)
-        time.sleep(abs((now.replace(minute=(now.minute+1)%60, second=0) - now).total_seconds())%61 +1)
-
 
-if util.check_arg(['--help', '-h'], sys.argv, return_result=False):
-    string = \
-        '-h   --help             | show this message\n' + \
-        '     --debug            | turn on debug mode (no login to uc, screenshots are saving)\n' + \
-        '     --debug-printing   | none, short (default) (additional info), full (all info), ultra\n' + \
-        '     --no-crash-log     | Disable crash logging\n' + \
-        '     --stop-after-crash | Stop the programm after executing Exception\n'
+if __name__ == '__main__':
+    if util.check_arg(['--help', '-h'], sys.argv, return_result=False):
+        string = \
+            '-h   --help             | show this message\n' + \
+            '     --debug            | turn on debug mode (no login to uc, screenshots are saving)\n' + \
+            '     --debug-printing   | none, short (default) (additional info), full (all info), ultra\n' + \
+            '     --no-crash-log     | Disable crash logging\n' + \
+            '     --stop-after-crash | Stop the programm after executing Exception\n'
 
-    print(string)
-    sys.exit()
+        print(string)
+        sys.exit()
 
-if util.debug:
-    util.print_if_debug('Debug mode on')
-print(f'debug_print_mode: {util.debug_print_mode}')
+    if util.debug:
+        util.print_if_debug('Debug mode on')
+    print(f'debug_print_mode: {util.debug_print_mode}')
 
-try:
-    main()
-except Exception:
-    crash_logging()
+    try:
+        main()
+    except Exception:
+        crash_logging()
@@ -0,0 +1,184 @@
+"""
+HTTP admin API, requests are executed by cli server (same commands as cli.py):
+    GET    /objects                 all configs
+    POST   /objects                 add object, body is its config
+    GET    /objects/<index|label>   config of object
+    PATCH  /objects/<index|label>   change config of object, body is changed fields
+    DELETE /objects/<index|label>   delete object
+    GET    /objects/<index|label>/stats
+    GET    /stats                   stats of all objects
+    GET    /executor                executor, browser pool and render cache stats
+    GET    /crashes, GET /crashes/<name>, DELETE /crashes
+    GET    /metrics                 Prometheus text format
+There is no authentication, passwords are not sent in replies.
+"""
+import json
+import asyncio
+import threading
+
+from constants import *
+from metrics import METRICS
+from job_executor import EXECUTOR
+from browser_pool import BROWSER_POOL
+from process_pool import PROCESS_POOL
+from urllib.parse import urlsplit, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+REDACTED = '********'
+STATUS_CODES = {'ok':200, 'rejected':400, 'not_found':404, 'failed':500, 'timeout':504}
+
+
+def redact(config):
+    """ Config of object without passwords, empty ones are kept empty """
+    return {key:(REDACTED if 'PASSWORD' in key and value else value) for key, value in config.items()}
+
+
+def register_gauges():
+    METRICS.add_gauge('uc_bot_executor_queue_depth', 'Jobs waiting in executor queue', lambda: EXECUTOR.stats()['queued'])
+    METRICS.add_gauge('uc_bot_executor_running', 'Jobs being executed', lambda: len(EXECUTOR.stats()['running']))
+
+    def browser_pool_usage():
+        stats = BROWSER_POOL.stats()
+        return {('size',):stats['size'], ('busy',):stats['busy'], ('idle',):stats['idle']}
+
+    def process_pool_usage():
+        stats = PROCESS_POOL.stats()
+        return {('workers',):stats['workers'], ('busy',):stats['busy'], ('waiting',):stats['waiting']}
+
+    if EXECUTION_MODE == 'process':
+        METRICS.add_gauge('uc_bot_process_pool', 'Render worker processes', process_pool_usage, ['state'])
+    else:
+        METRICS.add_gauge('uc_bot_browser_pool', 'Browsers of the pool', browser_pool_usage, ['state'])
+
+
+class UnsupportedMediaType(ValueError):
+    pass
+
+
+class AdminRequestHandler(BaseHTTPRequestHandler):
+    cli = None
+
+    def do_GET(self):
+        self.route('GET')
+
+    def do_POST(self):
+        self.route('POST')
+
+    def do_PATCH(self):
+        self.route('PATCH')
+
+    def do_DELETE(self):
+        self.route('DELETE')
+
+
+    def route(self, method):
+        parts = [unquote(part) for part in urlsplit(self.path).path.split('/') if part]
+
+        try:
+            if method == 'GET' and parts == ['metrics']:
+                return self.send(200, METRICS.render().encode(ENCODING), 'text/plain; version=0.0.4; charset=utf-8')
+
+            request = self.cli_request(method, parts)
+        except UnsupportedMediaType as e:
+            return self.send_json(415, {'error':str(e)})
+        except (ValueError, KeyError) as e:
+            return self.send_json(400, {'error':str(e.args[0] if e.args else e)})
+
+        if request is None:
+            return self.send_json(404, {'error':f'{method} {self.path} is not found'})
+
+        future = asyncio.run_coroutine_threadsafe(self.cli.execute(request), self.cli.loop)
+        replies = future.result()
+        if replies.status != 'ok':
+            return self.send_json(STATUS_CODES[replies.status], {'error':'\n'.join(map(str, replies))})
+
+        if request['reason'] == 'show_config':
+            replies = [redact(reply) for reply in replies]
+        elif request['reason'] == 'show_all_configs':
+            replies = [[redact(config) for config in reply] for reply in replies]
+        self.send_json(200, replies[0] if len(replies) == 1 else replies)
+
+
+    def cli_request(self, method, parts):
+        """ Converts HTTP request to cli server request, None if there is no such one """
+        if parts == ['objects']:
+            if method == 'GET':
+                return {'reason':'show_all_configs'}
+            if method == 'POST':
+                return {'reason':'add_object', 'payload':self.read_json()}
+        elif len(parts) in (2, 3) and parts[0] == 'objects':
+            obj = self.object_ref(parts[1])
+            if len(parts) == 3:
+                return dict(obj, reason='show_stat') if parts[2] == 'stats' and method == 'GET' else None
+            if method == 'GET':
+                return dict(obj, reason='show_config')
+            if method == 'PATCH':
+                return dict(obj, reason='change_config', payload=self.read_json())
+            if method == 'DELETE':
+                return dict(obj, reason='delete_object')
+        elif parts == ['stats'] and method == 'GET':
+            return {'reason':'show_all_stats'}
+        elif parts == ['executor'] and method == 'GET':
+            return {'reason':'show_executor_stats'}
+        elif parts == ['crashes']:
+            if method == 'GET':
+                return {'reason':'show_crashes'}
+            if method == 'DELETE':
+                return {'reason':'clear_crash_logs'}
+        elif len(parts) == 2 and parts[0] == 'crashes' and method == 'GET':
+            return {'reason':'show_crash_info', 'payload':parts[1]}
+        return None
+
+
+    def object_ref(self, value):
+        """ Object is sent by LABEL to be resolved by cli server when request is executed, number is index if there is no such LABEL """
+        if value.isnumeric() and value not in self.cli.indexes:
+            return {'index':int(value)}
+        return {'label':value}
+
+
+    def read_json(self):
+        # html forms of other sites cannot send json without CORS preflight, which is never answered here
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type != 'application/json':
+            raise UnsupportedMediaType(f'Body must be application/json, not {content_type or "missing"}')
+
+        size = int(self.headers.get('Content-Length', 0))
+        if size > CLI_MAX_FRAME_SIZE:
+            raise ValueError(f'Body of {size} bytes is too big')
+        return json.loads(self.rfile.read(size).decode(ENCODING))
+
+
+    def send_json(self, code, obj):
+        self.send(code, json.dumps(obj, ensure_ascii=False, default=str).encode(ENCODING), 'application/json; charset=utf-8')
+
+
+    def send(self, code, body, content_type):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+class AdminHTTPThread(threading.Thread):
+    def __init__(self, cli):
+        threading.Thread.__init__(self, name='admin-http', daemon=True)
+        handler = type('BoundAdminRequestHandler', (AdminRequestHandler,), {'cli':cli})
+        self.server = ThreadingHTTPServer((ADMIN_HTTP_IP, ADMIN_HTTP_PORT), handler)
+        self.server.daemon_threads = True
+        register_gauges()
+
+
+    def run(self):
+        self.server.serve_forever()
+
+
+    def quit(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -207,7 +207,7 @@ class AttachmentAPI(BaseAPI):
         self.files = files
         self.filename = filename
         self.file_type = file_type
-        response = self.send_request_post(timeout=5)
+        response = self.send_request_post()
         return response
 
     def download_file(self, attachment_id):
@@ -236,6 +236,6 @@ class AttachmentAPI(BaseAPI):
         self.filename = filename
         self.files = files
         self.file_type = file_type
-        response = self.send_request_post(timeout=10)
+        response = self.send_request_post()
         return response
 
@@ -195,7 +195,7 @@ class AttachmentAPI(BaseAPI):
         self.file_type = file_type
         self.mediasize = mediasize
         self.attachment_id = attachment_id
-        response = self.send_request_post(timeout=5)
+        response = self.send_request_post()
         return response
 
     def download_file(self, attachment_id, mediasize=None):
@@ -248,5 +248,5 @@ class AttachmentAPI(BaseAPI):
         self.filename = filename
         self.files = files
         self.file_type = file_type
-        response = self.send_request_post(timeout=10)
+        response = self.send_request_post()
         return response
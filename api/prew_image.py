@@ -1,40 +1,96 @@
 from PIL import Image
-import requests
+from constants import IMAGE_MEDIUM_SIZE, IMAGE_PREVIEW_SIZE, PNG_COMPRESS_LEVEL, MEDIUM_COMPRESS_LEVEL, PREVIEW_COMPRESS_LEVEL, \
+                      IMAGE_FORMATS, DEFAULT_IMAGE_FORMAT, IMAGE_QUALITY, IMAGE_COLORS
 import base64
 import io
 
 
-def prevImage(filename):
+def fit_size(width, height, size):
+    """ Size of image scaled so that its longest side is size """
+    M = max(width, height)
+    return max(1, int(size * width / M)), max(1, int(size * height / M))
 
-    img = Image.open(filename)
 
-    width, height = img.size
+def image_format_info(image_format=None):
+    image_format = (image_format or DEFAULT_IMAGE_FORMAT).lower()
+    if image_format == 'jpg':
+        image_format = 'jpeg'
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f'Unknown image format {image_format}, avaliable: {", ".join(IMAGE_FORMATS)}')
+    return image_format, IMAGE_FORMATS[image_format]
 
-    M = max(width, height)
 
-    width_300 = int(300 * width / M)
-    height_300 = int(300 * height / M)
+def encodable(img):
+    """ Stitched images are RGBX, encoders take RGB """
+    return img if img.mode in ('RGB', 'RGBA', 'L', 'P') else img.convert('RGB')
 
-    new_img = img.resize((width_300, height_300))
 
+def encode_png(img, compress_level, colors=0):
     in_mem_file = io.BytesIO()
-    new_img.save(in_mem_file, format="PNG")
-    img_file_size = in_mem_file.tell()
+    img = encodable(img)
+    if colors and img.mode != 'P':
+        # dashboards have few distinct colors, palette png is several times smaller
+        img = img.quantize(colors=colors, method=Image.FASTOCTREE)
+    img.save(in_mem_file, format="PNG", compress_level=compress_level, optimize=bool(colors))
     in_mem_file.seek(0)
-    img_bytes = in_mem_file.read()
+    return in_mem_file
+
 
-    width_40 = int(300 * width / M)
-    height_40 = int(300 * height / M)
+def encode_image(img, image_format=None, quality=None, colors=None, compress_level=PNG_COMPRESS_LEVEL):
+    """ Encodes image into BytesIO in png (optionally quantized to colors), jpeg or webp with quality """
+    image_format, info = image_format_info(image_format)
+    quality = IMAGE_QUALITY if quality is None else quality
+    colors = IMAGE_COLORS if colors is None else colors
 
-    new_img_2 = img.resize((width_40, height_40))
+    if image_format == 'png':
+        return encode_png(img, compress_level, colors)
+
+    in_mem_file = io.BytesIO()
+    if image_format == 'jpeg':
+        img.convert('RGB').save(in_mem_file, format=info['format'], quality=quality, optimize=True)
+    else:
+        encodable(img).save(in_mem_file, format=info['format'], quality=quality, method=4)
+    in_mem_file.seek(0)
+    return in_mem_file
 
-    in_mem_file_2 = io.BytesIO()
-    new_img_2.save(in_mem_file_2, format="PNG")
-    img_file_size_2 = in_mem_file_2.tell()
-    in_mem_file_2.seek(0)
-    img_bytes_2 = in_mem_file_2.read()
 
-    base64_encoded_result_bytes = base64.b64encode(img_bytes_2)
+def make_derivatives(img, image_format=None, quality=None, colors=None):
+    """
+    Makes full, 'm' and preview variants of decoded image in one pass:
+    'm' is downscaled from the full image and preview from 'm', so the full image is scanned only once.
+    Full and 'm' are encoded in image_format, preview is always png as it is inlined into the message.
+    :return: {variant: {'buffer': BytesIO, 'size', 'width', 'height', 'mimetype'}}, preview also has 'base64'
+    """
+    if img.mode not in ('RGB', 'RGBA', 'RGBX', 'L', 'P'):
+        img = img.convert('RGB')
+
+    width, height = img.size
+    # reducing_gap lets Pillow shrink by integer factor first, then resample the small image
+    medium = img.resize(fit_size(width, height, IMAGE_MEDIUM_SIZE), Image.BILINEAR, reducing_gap=2.0)
+    preview = medium.resize(fit_size(width, height, IMAGE_PREVIEW_SIZE), Image.BILINEAR, reducing_gap=2.0)
+
+    mimetype = image_format_info(image_format)[1]['mimetype']
+    derivatives = {
+        'full': (encode_image(img, image_format, quality, colors), img, mimetype),
+        'm': (encode_image(medium, image_format, quality, colors, MEDIUM_COMPRESS_LEVEL), medium, mimetype),
+        'preview': (encode_png(preview, PREVIEW_COMPRESS_LEVEL), preview, IMAGE_FORMATS['png']['mimetype']),
+    }
+
+    for variant, (buffer, variant_img, variant_mimetype) in derivatives.items():
+        derivatives[variant] = {'buffer': buffer, 'size': buffer.getbuffer().nbytes, 'mimetype': variant_mimetype,
+                                'width': variant_img.size[0], 'height': variant_img.size[1]}
+
+    derivatives['preview']['base64'] = base64.b64encode(derivatives['preview']['buffer'].getvalue()).decode()
+    return derivatives
+
+
+def prevImage(filename, image_format=None, quality=None, colors=None):
+
+    img = Image.open(filename)
+    derivatives = make_derivatives(img, image_format, quality, colors)
+
+    medium, preview = derivatives['m'], derivatives['preview']
+    width, height = img.size
 
-    return base64_encoded_result_bytes.decode(), img_file_size_2, img_bytes, img_file_size, width_300, height_300, width_40, height_40,\
-           width, height
+    return preview['base64'], preview['size'], medium['buffer'].getvalue(), medium['size'], medium['width'], \
+           medium['height'], preview['width'], preview['height'], width, height
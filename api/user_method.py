@@ -1,9 +1,9 @@
 """Swagger_API для отправки запросов users на сервис uc-access-layer-web"""
 import random
 
-from requests import get
 from libs.utils import Fake
 from libs.net.requests import http_post_request as post
+from libs.net.session_pool import get_session, endpoint_timeout
 from models.uc_api.uc_api_models import UserInfo, CreateUser, GeneralRequest
 from models.uc_api.mcptt_model.mcptt_login_response import MCPTTUserLoginResponse
 
@@ -39,7 +39,7 @@ class BaseAPI:
 
     def send_request_get(self):
         url = f"http://{self.ip}:{self.port}/uc/v2/{self.endpoint}"
-        response = get(url=url, headers=self.headers, stream=True)
+        response = get_session(url).get(url=url, headers=self.headers, stream=True, timeout=endpoint_timeout(url))
         return response
 
 
@@ -0,0 +1,189 @@
+import os
+import threading
+
+from constants import *
+from contextlib import contextmanager
+from util import print_if_debug
+from selenium import webdriver
+from selenium.webdriver import FirefoxOptions
+
+
+def new_firefox_driver():
+    opts = FirefoxOptions()
+    opts.add_argument("--headless")
+    return webdriver.Firefox(options=opts)
+
+
+def process_rss_mb(pid):
+    """ RSS of process and all its descendants (geckodriver, firefox and its content processes) in MB, None if unknown """
+    if not pid or not os.path.exists('/proc'):
+        return None
+
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        children.setdefault(int(stat.rsplit(')', 1)[1].split()[1]), []).append(int(entry))
+
+    pids = [int(pid)]
+    for p in pids:
+        pids.extend(children.get(p, []))
+
+    rss_kb = 0
+    for p in pids:
+        try:
+            with open(f'/proc/{p}/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+
+    return rss_kb / 1024
+
+
+class PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.renders = 0
+        self.pid = driver.capabilities.get('moz:processID')
+
+
+    def is_healthy(self):
+        try:
+            return self.driver.execute_script('return 1') == 1
+        except Exception:
+            return False
+
+
+    def rss_mb(self):
+        return process_rss_mb(self.pid)
+
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+
+class BrowserPool:
+    """
+    Bounded pool of warm headless browsers.
+    Drivers are created lazily, checked before checkout and recycled after max_renders renders
+    or when browser RSS grows over max_rss_mb.
+    """
+
+    def __init__(self, size=BROWSER_POOL_SIZE, max_renders=BROWSER_MAX_RENDERS, max_rss_mb=BROWSER_MAX_RSS_MB,
+                 driver_factory=new_firefox_driver):
+        self.size = size
+        self.max_renders = max_renders
+        self.max_rss_mb = max_rss_mb
+        self.driver_factory = driver_factory
+
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle = []
+        self.busy = {}
+
+        self.created = 0
+        self.recycled = 0
+
+
+    def checkout(self, timeout=None):
+        if not self.slots.acquire(timeout=timeout):
+            raise TimeoutError(f'No free browser in pool for {timeout} seconds')
+
+        try:
+            pooled = None
+            while pooled is None:
+                with self.lock:
+                    pooled = self.idle.pop() if self.idle else None
+
+                if pooled is None:
+                    pooled = PooledDriver(self.driver_factory())
+                    with self.lock:
+                        self.created += 1
+                elif not pooled.is_healthy():
+                    print_if_debug('Browser from pool is unhealthy, recycling it', 'full')
+                    self.discard(pooled)
+                    pooled = None
+
+            with self.lock:
+                self.busy[id(pooled.driver)] = pooled
+
+            return pooled.driver
+        except Exception:
+            self.slots.release()
+            raise
+
+
+    def checkin(self, driver, broken=False):
+        with self.lock:
+            pooled = self.busy.pop(id(driver), None)
+
+        if pooled is None:
+            return
+
+        try:
+            pooled.renders += 1
+
+            if broken or pooled.renders >= self.max_renders:
+                self.discard(pooled)
+                return
+
+            rss = pooled.rss_mb()
+            if rss is not None and rss > self.max_rss_mb:
+                print_if_debug(f'Browser RSS is {int(rss)} MB, recycling it', 'full')
+                self.discard(pooled)
+                return
+
+            try:
+                pooled.driver.get('about:blank')
+            except Exception:
+                self.discard(pooled)
+                return
+
+            with self.lock:
+                self.idle.append(pooled)
+        finally:
+            self.slots.release()
+
+
+    @contextmanager
+    def driver(self, timeout=None):
+        driver = self.checkout(timeout=timeout)
+        try:
+            yield driver
+        except Exception:
+            self.checkin(driver, broken=True)
+            raise
+        self.checkin(driver)
+
+
+    def discard(self, pooled):
+        pooled.quit()
+        with self.lock:
+            self.recycled += 1
+
+
+    def stats(self):
+        with self.lock:
+            return {'size':self.size, 'idle':len(self.idle), 'busy':len(self.busy),
+                    'created':self.created, 'recycled':self.recycled}
+
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for pooled in idle:
+            pooled.quit()
+
+
+BROWSER_POOL = BrowserPool()
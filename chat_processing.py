@@ -1,159 +1,264 @@
 import os
 import time
-import queue
+import uuid
 import random
-import threading
 import photographer
 
 from util import *
 from PIL import Image
 from constants import *
 from datetime import datetime
-from work_with_uc import login
 from work_with_uc import upload_file
-from api.prew_image import prevImage
+from work_with_uc import SESSIONS, SessionExpiredError
+from api.prew_image import make_derivatives, encode_image, image_format_info
+import job_events
 from crash_logging import crash_logging
+from image_dedup import fingerprint, images_unchanged, DELIVERED_IMAGES
+from render_cache import RENDER_CACHE, render_key
+from job_executor import EXECUTOR
+from process_pool import PROCESS_POOL
 from datetime import datetime, timedelta
-from api.group_chat_method import ChatApi
+from libs.net.http_client_async import UC_CLIENT, run_async
 from models.uc_api.uc_api_models import ChatEvent
 
 
-global stats_queue
-stats_queue = queue.Queue() # {"index":object_index, "string":some_string}
+def make_image_and_send_it(object_index, user, password, chats, urls, ip, port, grafana=None, renderer=None,
+                           send_parallel=CHAT_SEND_PARALLEL, send_batch_size=CHAT_SEND_BATCH_SIZE,
+                           image_format=None, image_quality=None, image_colors=None, dedup_key=None, unchanged_mode=None,
+                           unchanged_threshold=UNCHANGED_HASH_THRESHOLD, unchanged_text=UNCHANGED_TEXT,
+                           render_parallel=RENDER_PARALLEL_URLS, max_height=MAX_IMAGE_HEIGHT):
+    """
+    unchanged_mode: what to do when image is effectively identical to the last one delivered by dedup_key object,
+    'skip' - send nothing, 'text' - send only text of chats and unchanged_text, None - send image anyway
+    """
+    # true (or 1 set by cli) is not a mode, it would send text to every chat instead of skipping
+    if unchanged_mode and unchanged_mode not in UNCHANGED_MODES:
+        raise ValueError(f'Unknown SKIP_UNCHANGED {unchanged_mode!r}, avaliable: {", ".join(UNCHANGED_MODES)}')
 
-def make_image_and_send_it(object_index, session_id, my_user_id, chats, urls, ip, port, grafana=None):
-    global stats_queue
-    screenshot_filename = str(datetime.now().timestamp()).replace('.', '') + str(random.randint(1, 10**5)) + '.png'
+    image_format = image_format_info(image_format)[0]
+    screenshot_filename = str(datetime.now().timestamp()).replace('.', '') + str(random.randint(1, 10**5)) + f'.{image_format}'
 
     print_if_debug(f'Getting image from {urls}')
-    photographer.make_screen(urls, screenshot_filename=screenshot_filename, grafana=grafana)
+    # objects with the same urls share one render, the object itself always gets a new one
+    render_started = time.monotonic()
+    render = RENDER_CACHE.render((render_key(urls, grafana, renderer), max_height),
+                                 lambda: photographer.make_screen(urls, grafana=grafana, renderer=renderer, parallel=render_parallel,
+                                                                  max_height=max_height),
+                                 owner=dedup_key)
+    images = render.images
+    job_events.emit('rendered', seconds=time.monotonic() - render_started, images=len(images),
+                    scale=images[0].info.get('scale', 1))
     print_if_debug('Image got. Sending...')
 
     if debug:
         filename = f"{'_'.join(time.asctime().split(' '))}{screenshot_filename}"
-        Image.open(screenshot_filename).save(filename, 'PNG')
+        for index, image in enumerate(images):
+            with open(photographer.part_filename(filename, index), 'wb') as file:
+                file.write(encode_image(image, image_format, image_quality, image_colors).getbuffer())
 
-        result_rpeorting_string = f'{time.asctime()}   Image saved: {filename}'
+        print_if_debug(f'{time.asctime()}   Image saved: {filename}' + (f' ({len(images)} parts)' if len(images) > 1 else ''))
 
-        print_if_debug(result_rpeorting_string)
-
-        os.remove(screenshot_filename)
-        stats_queue.put({'index':object_index, 'string':result_rpeorting_string, 'type':'successes'})
+        job_events.emit('skipped', reason=f'debug mode, image saved: {filename}')
         return {'status_code': 200}
 
-    base64_preview_40, size_40, img_bytes_300, size_300, width_300, height_300, width_40, height_40, \
-    wight, height = prevImage(filename=screenshot_filename)
-
-    print_if_debug('made prevImage', 'full')
-
-    img = Image.open(screenshot_filename).resize((width_300, height_300))
-    thumbnail_filename = f"{time.asctime()}   {screenshot_filename.split('.')[0]}_thumbnail.png"
-    img.save(thumbnail_filename, 'PNG')
-
-    print_if_debug('thumbnail made', 'full')
-
-    attachment_id, file_size = upload_file(session_id, file_path=f"{SCREENSHOTPATH}/{screenshot_filename}", filename=screenshot_filename, ip=ip, port=port)
-    print_if_debug('image uploaded', 'full')
-    upload_file(session_id, file_path=f"{SCREENSHOTPATH}/{thumbnail_filename}", filename=thumbnail_filename, ip=ip, port=port, mediasize='m',
-                attachment_id=attachment_id)
-    print_if_debug('thumbnail uploaded', 'full')
-
-    for chat in chats:
-        if 'plain_text' in chat:
-            plain_text = chat['plain_text']
+    def send_chat_events(session_id, my_user_id, event_type, options, kind):
+        events = []
+        for chat in chats:
+            if 'plain_text' in chat:
+                plain_text = chat['plain_text']
+            else:
+                plain_text = ''
+
+            if event_type == 'TEXT':
+                plain_text = '\n'.join(text for text in (plain_text, unchanged_text) if text)
+
+            chat_id = int(chat['ID'])
+
+            message = {"uuid": str(uuid.uuid4()), "sender_id": my_user_id, "chat_id": chat_id,
+                       "chat_type": chat['type'], "type": event_type, "plaintext": plain_text}
+            if options is not None:
+                message['options'] = options
+
+            events.append(ChatEvent(**message))
+
+        print_if_debug('messages configured', 'full')
+
+        send_started = time.monotonic()
+        results = run_async(UC_CLIENT.send_events(ip, port, session_id, events, batch_size=send_batch_size, parallel=send_parallel))
+        print_if_debug('responses got', 'full')
+
+        for event, status_code, error in results:
+            if status_code in UC_SESSION_EXPIRED_CODES:
+                raise SessionExpiredError(f'UC session has expired, status code {status_code}')
+
+        status_codes = [status_code for (event, status_code, error) in results]
+        errors = [f'{chat["ID"]} {kind} has not been sent: {error}' for chat, (event, status_code, error) in zip(chats, results)
+                  if error is not None]
+        for error in errors:
+            print_if_debug(error)
+
+        failed = [status_code for (event, status_code, error) in results if error is not None]
+        job_events.emit('sent', seconds=time.monotonic() - send_started, kind=kind, successes=len(results) - len(failed),
+                        errors=len(failed), **({'error':errors[0]} if errors else {}))
+        return {'status_code': failed[0] if failed else (status_codes[0] if status_codes else 200), 'results': results}
+
+    image_fingerprint = None
+    if unchanged_mode and dedup_key is not None:
+        image_fingerprint = render.memo('fingerprint', lambda: tuple(fingerprint(image) for image in images))
+        if images_unchanged(DELIVERED_IMAGES.peek(dedup_key), image_fingerprint, hash_threshold=unchanged_threshold):
+            print_if_debug(f'Image of {dedup_key} has not changed', 'full')
+            if unchanged_mode == 'skip':
+                job_events.emit('skipped', reason='image has not changed')
+                return {'status_code': 200}
+
+            return SESSIONS.run(ip, port, user, password,
+                                lambda session_id, my_user_id: send_chat_events(session_id, my_user_id, 'TEXT', None, 'Text'))
+
+    # image is never written to disk, buffers are uploaded as they are
+    encoding = (image_format, image_quality, image_colors)
+    all_derivatives = render.memo(('derivatives',) + encoding, lambda: [make_derivatives(image, *encoding) for image in images])
+    filenames = [photographer.part_filename(screenshot_filename, index) for index in range(len(images))]
+
+    print_if_debug('derivatives made', 'full')
+
+    def send_image(session_id, my_user_id):
+        attachment_key = (ip, port) + encoding
+        attachments = render.attachment(attachment_key) if REUSE_ATTACHMENTS else None
+
+        if attachments is None:
+            upload_started = time.monotonic()
+            uploaded_bytes = 0
+            attachments = []
+            for filename, derivatives in zip(filenames, all_derivatives):
+                full, medium = derivatives['full'], derivatives['m']
+                attachment_id, file_size = upload_file(session_id, file_path=None, filename=filename, ip=ip, port=port,
+                                                       data=full['buffer'].getbuffer(), file_type=full['mimetype'])
+                print_if_debug('image uploaded', 'full')
+                upload_file(session_id, file_path=None, filename=f"{filename.split('.')[0]}_thumbnail.{image_format}", ip=ip, port=port,
+                            mediasize='m', attachment_id=attachment_id, data=medium['buffer'].getbuffer(), file_type=medium['mimetype'])
+                print_if_debug('thumbnail uploaded', 'full')
+                attachments.append((attachment_id, file_size))
+                uploaded_bytes += full['size'] + medium['size']
+            render.store_attachment(attachment_key, attachments)
+            job_events.emit('uploaded', seconds=time.monotonic() - upload_started, bytes=uploaded_bytes, images=len(attachments))
         else:
-            plain_text = ''
+            print_if_debug(f'attachments {[attachment[0] for attachment in attachments]} are reused', 'full')
 
-        chat_id = int(chat['ID'])
+        # image split into several parts is sent as one multi-image message
+        options = {"images": []}
+        for filename, derivatives, (attachment_id, file_size) in zip(filenames, all_derivatives, attachments):
+            full, medium, preview = derivatives['full'], derivatives['m'], derivatives['preview']
+            options['images'].append(
+                   {"attachment_id": attachment_id, "filename": filename, "size": file_size, "width": full['width'],
+                    "height": full['height'], "mimetype": full['mimetype'], "sizes": [{"size": "m", "width": medium['width'], "height": medium['height']}],
+                    "thumbnail": {"source": f"data:{preview['mimetype']};base64,{preview['base64']}", "width": preview['width'], "height": preview['height']}})
 
-        message = {"uuid": random.randint(1000, 99999), "sender_id": my_user_id, "chat_id": chat_id,
-                   "chat_type": chat['type'], "type": "IMAGE", "plaintext": plain_text,
-                   "options": {"images": [
-                       {"attachment_id": attachment_id, "filename": screenshot_filename, "size": file_size, "width": wight,
-                        "height": height, "mimetype": SCREENSHOTFILETYPE, "sizes": [{"size": "m", "width": width_300, "height": height_300}],
-                        "thumbnail": {"source": f"data:image/png;base64,{base64_preview_40}", "width": width_40, "height": height_40}}]}}
+        return send_chat_events(session_id, my_user_id, 'IMAGE', options, 'Image')
 
-        print_if_debug('message configured', 'full')
+    # relogin and resend once if cached session has expired
+    response = SESSIONS.run(ip, port, user, password, send_image)
 
-        send_message = [ChatEvent(**message)]
-        print_if_debug('ChatEvent', 'full')
-        url = None #TODO
-        response = ChatApi(data=send_message, ip=ip, port=port, cookie=session_id).group_chat_event_send(url)
-        print_if_debug('response made', 'full')
-        stats_queue.put({'index':object_index, 'string':f'{time.asctime()}   {chat["ID"]} Image has been made and sent with status code {response.status_code}', 'type':'successes'})
-
-    os.remove(screenshot_filename)
+    # image is remembered only when it has been delivered to all chats
+    if image_fingerprint is not None and all(error is None for (event, status_code, error) in response['results']):
+        DELIVERED_IMAGES.seed(dedup_key, image_fingerprint)
 
     return response
 
 
-def process_chats_2(object_index, chat_config, session_id, my_user_id):
-    global stats_queue
+def process_chats_2(object_index, chat_config):
+    job_events.start_job(chat_config.get('LABEL'), object_index)
     try:
         if 'GRAFANA' in chat_config and chat_config['GRAFANA'] and type(chat_config['GRAFANA']) == int:
             grafana = {"LOGIN":chat_config['GRAFANA_LOGIN'], "PASSWORD":chat_config['GRAFANA_PASSWORD']}
         else:
             grafana = None
-        res = make_image_and_send_it(object_index=object_index, session_id=session_id, my_user_id=my_user_id,
+        res = make_image_and_send_it(object_index=object_index, user=chat_config['UC_USER'], password=chat_config['UC_PASSWORD'],
                                      chats=chat_config['CHATS'], urls=chat_config['URLS'], 
                                      ip=chat_config['IP_UC_ACCESS_LAYER_WEB'], port=chat_config['PORT_UC_ACCESS_LAYER_WEB'],
-                                     grafana=grafana)['status_code']
+                                     grafana=grafana, renderer=chat_config.get('RENDERER'),
+                                     send_parallel=int(chat_config.get('SEND_PARALLEL', CHAT_SEND_PARALLEL)),
+                                     send_batch_size=int(chat_config.get('SEND_BATCH_SIZE', CHAT_SEND_BATCH_SIZE)),
+                                     image_format=chat_config.get('IMAGE_FORMAT'), image_quality=chat_config.get('IMAGE_QUALITY'),
+                                     image_colors=chat_config.get('IMAGE_COLORS'), dedup_key=chat_config.get('LABEL'),
+                                     unchanged_mode=chat_config.get('SKIP_UNCHANGED'),
+                                     unchanged_threshold=int(chat_config.get('UNCHANGED_THRESHOLD', UNCHANGED_HASH_THRESHOLD)),
+                                     unchanged_text=chat_config.get('UNCHANGED_TEXT', UNCHANGED_TEXT),
+                                     render_parallel=int(chat_config.get('RENDER_PARALLEL', RENDER_PARALLEL_URLS)),
+                                     max_height=int(chat_config.get('MAX_IMAGE_HEIGHT', MAX_IMAGE_HEIGHT)))['status_code']
         print_if_debug(f"{res} for {', '.join([str(i) for i in chat_config['URLS']])} {chat_config['CHATS']}", end='\n\n')
+        job_events.finish_job(status_code=res)
         return
-    except Exception:
+    except Exception as e:
         crash_log = crash_logging(addition_string=str(chat_config['URLS'])+'\n'+str(chat_config['CHATS']))
-        stats_queue.put({'index':object_index, 'string':f'{time.asctime()}   Crashed, log is saved in {crash_log}', 'type':'errors'})
+        job_events.finish_job('failed', error=repr(e), crash_log=crash_log)
         return
 
 
-def process_chats(objects, first_iteration, db=False):
-    global debug, stats_queue
+def run_in_worker_process(object_index, chat_config, session, image_fingerprint=None):
+    """
+    Executed in render worker process,
+    returns events of the job, current UC session and fingerprint of the last delivered image
+    """
+    ip, port, user = chat_config['IP_UC_ACCESS_LAYER_WEB'], chat_config['PORT_UC_ACCESS_LAYER_WEB'], chat_config['UC_USER']
+    SESSIONS.seed(ip, port, user, session)
+    DELIVERED_IMAGES.seed(chat_config.get('LABEL'), image_fingerprint)
+
+    job_events.start_collecting()
+    try:
+        process_chats_2(object_index, chat_config)
+    finally:
+        events = job_events.stop_collecting()
+
+    return {'session':SESSIONS.peek(ip, port, user), 'fingerprint':DELIVERED_IMAGES.peek(chat_config.get('LABEL')),
+            'events':events}
+
+
+def process_chats_2_in_process(object_index, chat_config):
+    ip, port, user = chat_config['IP_UC_ACCESS_LAYER_WEB'], chat_config['PORT_UC_ACCESS_LAYER_WEB'], chat_config['UC_USER']
+    try:
+        # worker processes share sessions of the main process, refreshed ones are taken back
+        session = SESSIONS.get(ip, port, user, chat_config['UC_PASSWORD'])
+        # so do fingerprints of delivered images
+        image_fingerprint = DELIVERED_IMAGES.peek(chat_config.get('LABEL'))
+        result = PROCESS_POOL.run(run_in_worker_process, args=(object_index, chat_config, session, image_fingerprint))
+        SESSIONS.seed(ip, port, user, result['session'])
+        DELIVERED_IMAGES.seed(chat_config.get('LABEL'), result['fingerprint'])
+
+        # events of the job are published when it is done
+        for event in result['events']:
+            job_events.publish(event)
+    except Exception as e:
+        crash_log = crash_logging(addition_string=str(chat_config['URLS'])+'\n'+str(chat_config['CHATS']))
+        job_events.start_job(chat_config.get('LABEL'), object_index)
+        job_events.finish_job('failed', error=repr(e), crash_log=crash_log)
+
+
+def process_chats(objects, due, indexes, db=False):
+    """
+    Submits due objects to executor, their stats are collected from job events (stats_store).
+    indexes is LABEL -> index of object in objects
+    """
+    global debug
     db = debug
 
     debug_log = []
 
-    for i in range(len(objects)):
-        if 'STATS' not in objects[i]:
-            objects[i]['STATS'] = {"successes":[], "errors":[], 'stats':[]}
-
-        obj = objects[i]
-        ip = obj['IP_UC_ACCESS_LAYER_WEB']
-        port = obj['PORT_UC_ACCESS_LAYER_WEB']
-        user = obj['UC_USER']
-        password = obj['UC_PASSWORD']
-
-        if 'time' in obj or first_iteration:
-            now = datetime.now()
-            check = datetime_in_conditions(now, conditions=obj['time'])
-            if check == True:
-                session_id, my_user_id = login(ip, port, user, password, debug=debug)
-                obj['time'] = update_timers(now, obj['time'])
-
-                '''
-                msg = f'Began making image {obj["LABEL"]}\n\n'
-                print(msg)
-                debug_log.append(msg)
-                '''
-                threading.Thread(target=process_chats_2, args=(i, obj, session_id, my_user_id), daemon=True).start()
-
-                #objects[i]['STATS']['stats'].append(f'{time.asctime()}   Began making image')
-            elif check == False:
-                obj['time'] = update_conditions(now, obj['time'])
-
-    while not stats_queue.empty():
-        stat = stats_queue.get()
-        while len(objects[stat['index']]['STATS']['stats']) >= STATS_LIMIT:
-
-            string = objects[stat['index']]['STATS']['stats'][0]
-            objects[stat['index']]['STATS']['stats'].remove(string)
-
-            if string in objects[stat['index']]['STATS']['errors']:
-                objects[stat['index']]['STATS']['errors'].remove(string)
-
-            if string in objects[stat['index']]['STATS']['successes']:
-                objects[stat['index']]['STATS']['successes'].remove(string)
-
-        objects[stat['index']]['STATS'][stat['type']].append(stat['string'])
-        objects[stat['index']]['STATS']['stats'].append(stat['string'])
+    for obj in due:
+        i = indexes.get(obj['LABEL'])
+        # object has been deleted or replaced while it was waiting
+        if i is None or i >= len(objects) or objects[i] is not obj:
+            continue
+
+        if JOB_DEDUP_MODE == 'skip' and EXECUTOR.is_busy(obj['LABEL']):
+            print_if_debug(f'{obj["LABEL"]} is still being processed, skipping', 'full')
+            continue
+
+        '''
+        msg = f'Began making image {obj["LABEL"]}\n\n'
+        print(msg)
+        debug_log.append(msg)
+        '''
+        target = process_chats_2_in_process if EXECUTION_MODE == 'process' else process_chats_2
+        EXECUTOR.submit(obj['LABEL'], target, args=(i, obj), priority=obj.get('PRIORITY', 0))
 
     return objects, debug_log
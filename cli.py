@@ -2,28 +2,45 @@ import os
 import sys
 import json
 import time
+import struct
 import socket
 import readline
 
 
 #CONFIG = 'cli_connection_config.json'
+TIMEOUT = 45 # seconds to wait for reply, server answers within its CLI_REQUEST_TIMEOUT (30 by default)
+MAX_FRAME_SIZE = 64 * 2**20
+OBJECTS_TTL = 10 # seconds to use fetched configs before fetching them again
 
 
 class CLI:
 	def __init__(self):
 		self.load_settings()
 		self.objects = []
+		self.objects_fetched = None
 		self.vars = ['LABEL', 'URLS', 'CHATS', 'time', 'UC_USER', 'UC_PASSWORD', 'GRAFANA_LOGIN', 
 						'GRAFANA_PASSWORD', 'USER_API_REQUEST_ADDR', 'IP_UC_ACCESS_LAYER_WEB', 'PORT_UC_ACCESS_LAYER_WEB']
 
+		self.connect()
+
+		readline.parse_and_bind("tab: complete")
+		readline.set_completer(self.string_completer)
+
+	def connect(self):
 		self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 		self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 		#self.sock.setblocking(0)
-		self.sock.settimeout(0.3)
+		self.sock.settimeout(TIMEOUT)
 		self.sock.connect(self.server_address)
 
-		readline.parse_and_bind("tab: complete")
-		readline.set_completer(self.string_completer)
+	def reconnect(self):
+		""" Reply which has not been read would be taken for reply of the next request, so connection is replaced """
+		self.sock.close()
+		try:
+			self.connect()
+		except OSError as e:
+			self.sock.close()
+			print(f'Cannot reconnect to {self.server_address[0]}:{self.server_address[1]}: {e}')
 
 	def load_settings(self):
 			self.encoding = 'utf-8'
@@ -37,12 +54,14 @@ class CLI:
 		main_menu = {'show_stat_of_certain_object':self.show_stat, 'show_config_of_certain_object':self.show_config, 'show_all_stats':self.show_all_stats, 
 						"show_all_configs":self.show_all_configs, "change_config":self.change_config, "add_object":self.add_object, 
 						"delete_object":self.delete_object, "show_crashes":self.show_crashes, "show_crash_info":self.show_crash_info,
-						"clear_crash_logs":self.clear_crash_logs, 'quit':self.quit}
+						"clear_crash_logs":self.clear_crash_logs, "show_executor_stats":self.show_executor_stats, 
+						"tail":self.tail, 'quit':self.quit}
 
 		secret_commands = {} #{'debug_log':self.debug_log}
 
 		self.commands_with_labels = ['show_config_of_certain_object', 'show_stat_of_certain_object', 'change_config', 'delete_object']
-		self.commands_with_args = self.commands_with_labels + ['show_all_stats']
+		self.commands_with_args = self.commands_with_labels + ['show_all_stats', 'tail']
+		self.commands_changing_objects = ['change_config', 'delete_object']
 
 		while self.update_objects() == 0:
 			pass
@@ -67,7 +86,8 @@ class CLI:
 			if command[0] not in main_menu:
 				continue
 
-			if self.update_objects() == 0:
+			# object to change is taken from configs fetched right before, server finds it by its label
+			if self.update_objects(force=command[0] in self.commands_changing_objects) == 0:
 				continue
 
 			if command[0] in self.commands_with_args:
@@ -78,40 +98,42 @@ class CLI:
 			self.labels = [obj['LABEL'] for obj in self.objects]
 
 
-	def update_objects(self):
+	def update_objects(self, force=False):
+		""" Fetches configs of all objects, fetched ones are used for OBJECTS_TTL seconds unless force """
+		if not force and self.objects_fetched is not None and time.monotonic() - self.objects_fetched < OBJECTS_TTL:
+			return
+
+		self.objects_fetched = None
 		info = {'reason':'show_all_configs'}
-		self.sock.send(self.prepare_object_to_sending(info))
+		self.send_request(info)
 		self.objects = self.get_information()
-		self.labels = [obj['LABEL'] for obj in self.objects]
 
-		if self.objects == None:
+		if type(self.objects) != list:
 			self.objects = []
-		elif type(self.objects) == str:
+			self.labels = []
 			print('Sudden network error occured, try again')
 			return 0
 
+		self.labels = [obj['LABEL'] for obj in self.objects]
+		self.objects_fetched = time.monotonic()
+
 
 	def show_stat(self, cmd):
 		index = self.get_index_from_command(cmd)
 		if index == None:
 			return
 
-		info = {'reason':'show_stat', 'index':index}
-		self.sock.send(self.prepare_object_to_sending(info))
+		info = {'reason':'show_stat', 'label':self.objects[index]['LABEL']}
+		self.send_request(info)
 
 		print('\n STATS:')
 		stat = self.get_information()
 
-		print(f'Total: {len(stat["errors"]) + len(stat["successes"])}')
-		print(f'Successes: {len(stat["successes"])}')
-		print(f'Errors: {len(stat["errors"])}')
+		if not stat:
+			print('Stats error')
+			return
 
-		if 'errors' in cmd:
-			print('\n'.join(stat['errors']), end = '\n')
-		elif 'successes' in cmd:
-			print('\n'.join(stat['successes']), end = '\n')
-		else:
-			print('\n'.join(stat['stats']), end = '\n')
+		self.print_stat(stat, cmd)
 
 
 	def show_config(self, cmd=None, index=None):
@@ -133,7 +155,7 @@ class CLI:
 
 	def debug_log(self):
 		info = {'reason':'debug_log'}
-		self.sock.send(self.prepare_object_to_sending(info))
+		self.send_request(info)
 
 		log = self.get_information()
 
@@ -143,8 +165,9 @@ class CLI:
 
 
 	def show_all_stats(self, cmd):
-		info = {'reason':'show_all_stats'}
-		self.sock.send(self.prepare_object_to_sending(info))
+		# records are fetched only when they are going to be printed
+		info = {'reason':'show_all_stats', 'records':'errors' in cmd or 'successes' in cmd}
+		self.send_request(info)
 
 		stats = self.get_information()
 
@@ -155,18 +178,69 @@ class CLI:
 		for i in range(len(stats)):
 			obj = stats[i]
 
-			if obj:
+			if obj and i < len(self.objects):
 				print('\n')
 				print(f"{i} {self.objects[i]['LABEL']}:")
-				print(f'Total: {len(obj["errors"]) + len(obj["successes"])}')
-				print(f'Successes: {len(obj["successes"])}')
-				print(f'Errors: {len(obj["errors"])}')
-				if 'errors' in cmd:
-					print('\n'.join(obj['errors']), end = '\n')
-				elif 'successes' in cmd:
-					print('\n'.join(obj['successes']), end = '\n')
-				elif obj['stats']:
-					print('\n'.join(obj['stats']), end = '\n')
+				self.print_stat(obj, cmd)
+
+
+	def print_stat(self, stat, cmd):
+		aggregates = stat['aggregates']
+		print(f"Total: {aggregates['count']}")
+		print(f"Successes: {aggregates['successes']}")
+		print(f"Errors: {aggregates['errors']} ({aggregates['error_rate']:.1%})")
+		if aggregates['p50_seconds'] is not None:
+			print(f"Latency: p50 {aggregates['p50_seconds']:.2f}s, p95 {aggregates['p95_seconds']:.2f}s, mean {aggregates['mean_seconds']:.2f}s")
+
+		records = stat.get('records', [])
+		if 'errors' in cmd:
+			records = [record for record in records if record['status'] in ('failed', 'partial')]
+		elif 'successes' in cmd:
+			records = [record for record in records if record['status'] not in ('failed', 'partial')]
+
+		for record in records:
+			print(self.format_record(record))
+
+
+	def format_record(self, record):
+		string = f"{time.asctime(time.localtime(record['time']))}   {record['status']} in {record['seconds']:.2f}s"
+
+		phases = [f'{phase} {record[phase + "_seconds"]:.2f}s' for phase in ('render', 'upload', 'send') if record[phase + '_seconds'] is not None]
+		if phases:
+			string += f" ({', '.join(phases)})"
+		if record.get('scale', 1) < 1:
+			string += f", downscaled by {record['scale']:.2f}"
+		if record['bytes']:
+			string += f", {record['bytes'] // 1024} KiB uploaded"
+		if record['successes'] or record['errors']:
+			string += f", sent to {record['successes']} of {record['successes'] + record['errors']} chats"
+		if record['status_code'] is not None:
+			string += f", status code {record['status_code']}"
+
+		for key in ('reason', 'error'):
+			if record[key]:
+				string += f", {record[key]}"
+		if record['crash_log']:
+			string += f", log is saved in {record['crash_log']}"
+		return string
+
+
+	def show_executor_stats(self):
+		info = {'reason':'show_executor_stats'}
+		self.send_request(info)
+
+		stats = self.get_information()
+
+		if not stats:
+			print('Stats error')
+			return
+
+		for section in stats:
+			print(f'\n{section}:')
+			for key in stats[section]:
+				print(f'  {key}:', stats[section][key])
+
+		print('\n')
 
 
 	def show_all_configs(self):
@@ -190,6 +264,7 @@ class CLI:
 
 		self.show_config(index=index)
 		self.changing_config = dict(self.objects[index])
+		self.changing_label = self.objects[index]['LABEL']
 
 		self.state = 'change_config'
 		self.current_commands = ['set', 'rm', 'add_url', 'rm_url', 'add_chat', 'rm_chat']
@@ -275,10 +350,11 @@ class CLI:
 
 
 		if cfg:
-			info = {'reason':'change_config', 'index':index, 'payload':cfg}
-			self.sock.send(self.prepare_object_to_sending(info))
+			info = {'reason':'change_config', 'label':self.changing_label, 'payload':cfg}
+			self.send_request(info)
 
 			print(self.get_information())
+			self.update_objects(force=True)
 
 		self.changing_config = None
 
@@ -305,9 +381,10 @@ class CLI:
 				config[var] = ""
 
 		info = {'reason':'add_object', 'payload':config}
-		self.sock.send(self.prepare_object_to_sending(info))
+		self.send_request(info)
 
 		print(self.get_information())
+		self.update_objects(force=True)
 
 
 	def delete_object(self, cmd):
@@ -315,15 +392,63 @@ class CLI:
 		if index == None:
 			return
 
-		info = {'reason':'delete_object', 'index':index}
-		self.sock.send(self.prepare_object_to_sending(info))
+		info = {'reason':'delete_object', 'label':self.objects[index]['LABEL']}
+		self.send_request(info)
 
 		print(self.get_information())
+		self.update_objects(force=True)
+
+
+	def tail(self, cmd):
+		""" Prints job events of objects (all if labels are not given) as they happen, Ctrl+C stops it """
+		labels = [label for label in cmd[1:] if label]
+		for label in labels:
+			if label not in self.labels:
+				print(f'There is no object {label}')
+				return
+
+		info = {'reason':'subscribe', 'objects':labels}
+		self.send_request(info)
+		if self.get_information() != 'Subscribed':
+			return
+
+		print(f"Tailing {', '.join(labels) or 'all objects'} (Ctrl+C - stop)")
+		self.sock.settimeout(None)
+		try:
+			while True:
+				reply = self.get_information()
+				if reply is None:
+					return
+				if type(reply) == dict and 'event' in reply:
+					self.print_event(reply['event'])
+		except KeyboardInterrupt:
+			print()
+		finally:
+			self.sock.settimeout(TIMEOUT)
+
+		self.send_request({'reason':'unsubscribe'})
+		# events sent before server got unsubscribe are skipped
+		reply = None
+		while reply not in ('Unsubscribed', None):
+			reply = self.get_information()
+
+
+	def print_event(self, event):
+		fields = []
+		for key, value in event.items():
+			if key in ('time', 'job', 'object', 'index', 'phase', 'crash_log'):
+				continue
+			if type(value) == float:
+				value = f'{value:.2f}'
+			fields.append(f'{key}={value}')
+
+		stamp = time.strftime('%H:%M:%S', time.localtime(event['time']))
+		print(f"{stamp} {event['object']} {event['phase']} {' '.join(fields)}")
 
 
 	def get_crashes(self):
 		info = {'reason':'show_crashes'}
-		self.sock.send(self.prepare_object_to_sending(info))
+		self.send_request(info)
 
 		return self.get_information()
 
@@ -346,7 +471,7 @@ class CLI:
 			return
 
 		info = {'reason':'show_crash_info', 'payload':filename}
-		self.sock.send(self.prepare_object_to_sending(info))
+		self.send_request(info)
 
 		print('\n')
 		print(self.get_information(parse=False), end='\n\n')
@@ -354,7 +479,7 @@ class CLI:
 
 	def clear_crash_logs(self):
 		info = {'reason':'clear_crash_logs'}
-		self.sock.send(self.prepare_object_to_sending(info))
+		self.send_request(info)
 
 		print(self.get_information(), end='\n\n')
 
@@ -371,27 +496,31 @@ class CLI:
 		return len(self.objects) == 0
 
 
-	def recieve_data(self, size=2**15):
-		return self.sock.recv(size).decode(self.encoding)
+	def recieve_data(self, size):
+		""" Reads exactly size bytes, recv may return only a part of them """
+		data = bytearray()
+		while len(data) < size:
+			chunk = self.sock.recv(min(size - len(data), 2**16))
+			if not chunk:
+				raise ConnectionError('Connection is closed by server')
+			data += chunk
+		return bytes(data)
 
 
 	def get_information(self, parse=True):
-		info = self.recieve_data()
+		""" Reads one reply frame: JSON prefixed by its length (4 bytes, big-endian) """
 		try:
-			info += self.recieve_data()
-			info += self.recieve_data()
-		except:
-			pass
+			size = struct.unpack('>I', self.recieve_data(4))[0]
+			if size > MAX_FRAME_SIZE:
+				raise ValueError(f'Reply of {size} bytes is too big')
+			info = json.loads(self.recieve_data(size).decode(self.encoding))
+		except (OSError, ValueError) as e:
+			print(f'Cannot get reply: {e}')
+			self.reconnect()
+			return None
 
-		if parse and ('[' in info or '{' in info):
-			try:
-				info = info.replace('True', '1')
-				info = info.replace('False', '0')
-				info = info.replace('None', 'null')
-				return json.loads(info)
-			except json.decoder.JSONDecodeError:
-				print(info)
-				return None #self.get_information()
+		if not parse and type(info) != str:
+			return json.dumps(info, ensure_ascii=False)
 		return info
 
 
@@ -472,12 +601,18 @@ class CLI:
 		return res
 
 
-	def prepare_object_to_sending(self, obj, split_data=False):
-		if split_data:
-			string = str(obj) + '\n'
-		else:
-			string = str(obj)
-		return string.replace("'", '"').encode(self.encoding)
+	def prepare_object_to_sending(self, obj):
+		body = json.dumps(obj, ensure_ascii=False).encode(self.encoding)
+		return struct.pack('>I', len(body)) + body
+
+
+	def send_request(self, info):
+		# sendall repeats send until the whole frame is written
+		try:
+			self.sock.sendall(self.prepare_object_to_sending(info))
+		except OSError as e:
+			# reply is not read then, connection is replaced by get_information
+			print(f'Cannot send request: {e}')
 
 
 	def string_completer(self, text, state):
@@ -494,6 +629,9 @@ class CLI:
 				if buffer[0] == 'show_stat_of_certain_object':
 					commands = ['errors', 'successes']
 
+			if len(buffer) >= 2 and buffer[0] == 'tail':
+				commands = [label for label in self.labels if label not in buffer[1:-1]]
+
 		if self.state == 'change_config':
 			#buffer = list(filter(('').__ne__, buffer))
 
@@ -1,101 +1,257 @@
 import os
 import util
 import time
+import copy
 import json
-import socket
-import select
+import struct
+import asyncio
 import threading
+import job_events
 
 from constants import *
+from schedule import compile_schedule
+from job_executor import EXECUTOR
+from browser_pool import BROWSER_POOL
+from process_pool import PROCESS_POOL
+from image_dedup import DELIVERED_IMAGES
+from render_cache import RENDER_CACHE
+from stats_store import STATS_STORE
+
+
+class ObjectNotFoundError(LookupError):
+    pass
+
+
+class Replies(list):
+    """ Replies of request with its outcome: ok, rejected (bad request), not_found, failed or timeout """
+    status = 'ok'
 
 
 class CLIThread(threading.Thread):
-    def __init__(self, objects):
-        threading.Thread.__init__(self, daemon=True)
+    """
+    cli control server, runs asyncio event loop in its own thread: every connection is served by its own task
+    (subscribed connections also get job events as they happen),
+    replies are written with backpressure (slow client is disconnected after CLI_WRITE_TIMEOUT),
+    requests doing file I/O are executed in threads, so they do not stall other connections
+    """
+
+    # requests executed in threads, requests changing objects and config file are executed one at a time
+    BLOCKING_REASONS = {'show_crashes', 'show_crash_info', 'clear_crash_logs', 'change_config', 'add_object', 'delete_object'}
+    EXCLUSIVE_REASONS = {'clear_crash_logs', 'change_config', 'add_object', 'delete_object'}
+
+    def __init__(self, objects, scheduler):
+        threading.Thread.__init__(self, name='cli-server', daemon=True)
         self.objects = objects
+        self.scheduler = scheduler
+        self.update_indexes()
 
-        self.sock = socket.socket()
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.sock.bind((CLI_IP, CLI_PORT))
-        self.sock.listen(5)
-        self.inputs = [self.sock]
-        self.outputs = []
-
-        self.requests = {}
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(asyncio.start_server(self.serve_connection, CLI_IP, CLI_PORT,
+                                                                        reuse_address=True))
+        self.config_lock = asyncio.Lock()
+        self.connections = set()
 
         self.debug_log = []
 
 
-    def accept_connection(self, s):
-        conn, addr = s.accept()
-        conn.setblocking(0)
-        self.inputs.append(conn)
-        print(f'{addr} is connected to cli')
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
 
 
-    def run(self):
-        while self.inputs:
-            self.readable, self.writable, self.exceptional = select.select(self.inputs, self.outputs, self.inputs)
+    def update_indexes(self):
+        """ LABEL -> index of object, replaced as a whole, so main thread always reads a complete one """
+        self.indexes = {obj['LABEL']:i for i, obj in enumerate(self.objects)}
 
-            for s in self.readable:
-                if s == self.sock:
-                    self.accept_connection(s)
+
+    @staticmethod
+    async def read_frame(reader):
+        """ Returns next request (see util.encode_frame) or None when connection is closed """
+        try:
+            header = await reader.readexactly(4)
+        except asyncio.IncompleteReadError:
+            return None
+
+        size = struct.unpack('>I', header)[0]
+        if size > CLI_MAX_FRAME_SIZE:
+            raise ValueError(f'Frame of {size} bytes is over {CLI_MAX_FRAME_SIZE} bytes limit')
+
+        # once request has begun, it should arrive whole in time
+        body = await asyncio.wait_for(reader.readexactly(size), CLI_REQUEST_TIMEOUT)
+        return json.loads(body.decode(ENCODING))
+
+
+    async def serve_connection(self, reader, writer):
+        addr = writer.get_extra_info('peername')
+        writer.transport.set_write_buffer_limits(high=CLI_WRITE_BUFFER_LIMIT)
+        self.connections.add(writer)
+        print(f'{addr} is connected to cli')
+
+        # replies and events of subscription are written by sender task in order they are queued
+        outgoing = asyncio.Queue(maxsize=CLI_SUBSCRIBER_QUEUE_SIZE)
+        sender = self.loop.create_task(self.send_frames(writer, outgoing))
+        subscription = None
+
+        try:
+            while True:
+                data = await self.read_frame(reader)
+                if data is None:
+                    break
+
+                if data.get('reason') == 'subscribe':
+                    self.unsubscribe(subscription)
+                    subscription = self.subscribe(outgoing, data.get('objects'))
+                    replies = ['Subscribed']
+                elif data.get('reason') == 'unsubscribe':
+                    self.unsubscribe(subscription)
+                    subscription = None
+                    replies = ['Unsubscribed']
                 else:
-                    try:
-                        data = s.recv(512)
-                    except:
-                        self.disconnect(s)
-                        continue
-
-                    if data:
-                        try:
-                            data = json.loads(data.decode(ENCODING))
-                        except Exception as e:
-                            print(e)
-                            continue
-
-                        self.requests[s] = data
-                        if s not in self.outputs:
-                            self.outputs.append(s)
-
-            #time.sleep(.1)
-
-            for s in self.writable:
-                self.outputs.remove(s)
-                if s in self.requests:
-                    data = self.requests[s]
-
-                    if data['reason'] == 'show_stat':
-                        self.show_stat(s, data['index'])
-                    elif data['reason'] == 'show_all_stats':
-                        self.show_all_stats(s)
-                    elif data['reason'] == 'show_config':
-                        self.show_config(s, data['index'])
-                    elif data['reason'] == 'show_all_configs':
-                        self.show_all_configs(s)
-                    elif data['reason'] == 'change_config':
-                        self.change_config(s, data['index'], data['payload'])
-                    elif data['reason'] == 'add_object':
-                        self.add_object(s, data['payload'])
-                    elif data['reason'] == 'delete_object':
-                        self.delete_object(s, data['index'])
-                    elif data['reason'] == 'show_crashes':
-                        self.show_crashes(s)
-                    elif data['reason'] == 'show_crash_info':
-                        self.show_crash_info(s, data['payload'])
-                    elif data['reason'] == 'clear_crash_logs':
-                        self.clear_crash_logs(s)
-                    elif data['reason'] == 'debug_log':
-                        self.show_debug_log(s)
-
-                    del self.requests[s]
-
-
-    def get_stat(self, index):
-        if 'STATS' in self.objects[index]:
-            return self.objects[index]['STATS']
+                    replies = await self.execute(data)
+
+                for reply in replies:
+                    await outgoing.put(reply)
+        except (asyncio.TimeoutError, ConnectionError, ValueError) as e:
+            print(f'{addr} is disconnected from cli: {e!r}')
+        finally:
+            self.unsubscribe(subscription)
+            sender.cancel()
+            self.connections.discard(writer)
+            writer.close()
+
+
+    async def send_frames(self, writer, outgoing):
+        try:
+            while True:
+                writer.write(util.encode_frame(ENCODING, await outgoing.get()))
+                # waits while client does not read and buffer is over the limit
+                await asyncio.wait_for(writer.drain(), CLI_WRITE_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            print(f'{writer.get_extra_info("peername")} does not read replies, disconnecting: {e!r}')
+            writer.close()
+
+
+    def subscribe(self, outgoing, labels=None):
+        """
+        Streams job events of objects with labels (all objects if not given) as {'event': event} frames.
+        Events which do not fit into the queue of slow client are dropped, the next event tells how many of them
+        """
+        dropped = [0]
+
+        def push(event):
+            try:
+                if dropped[0]:
+                    event = dict(event, dropped=dropped[0])
+                outgoing.put_nowait({'event':event})
+                dropped[0] = 0
+            except asyncio.QueueFull:
+                dropped[0] += 1
+
+        def listener(event):
+            if not labels or event['object'] in labels:
+                self.loop.call_soon_threadsafe(push, event)
+
+        job_events.add_listener(listener)
+        return listener
+
+
+    def unsubscribe(self, listener):
+        if listener is not None:
+            job_events.remove_listener(listener)
+
+
+    async def execute(self, data):
+        """ Executes request within CLI_REQUEST_TIMEOUT, returns Replies """
+        replies = Replies()
+        try:
+            reason = data['reason']
+            if reason not in self.BLOCKING_REASONS:
+                self.handle_request(replies, data)
+            elif reason not in self.EXCLUSIVE_REASONS:
+                await asyncio.wait_for(self.loop.run_in_executor(None, self.handle_request, replies, data), CLI_REQUEST_TIMEOUT)
+            else:
+                # waiting for the lock is a part of the request too
+                await asyncio.wait_for(self.execute_exclusive(replies, data), CLI_REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            return self.outcome('timeout', f'Request has timed out after {CLI_REQUEST_TIMEOUT} seconds')
+        except (FileNotFoundError, ObjectNotFoundError) as e:
+            return self.outcome('not_found', f'Request has failed: {e}')
+        except (KeyError, IndexError, ValueError, TypeError) as e:
+            return self.outcome('rejected', f'Request has failed: {e!r}')
+        except Exception as e:
+            return self.outcome('failed', f'Request has failed: {e}')
+
+        return replies
+
+
+    async def execute_exclusive(self, replies, data):
+        await self.config_lock.acquire()
+        # thread is not stopped by timeout, so lock is released only when request is finished
+        future = self.loop.run_in_executor(None, self.handle_request, replies, data)
+        future.add_done_callback(lambda future: self.config_lock.release())
+        await asyncio.shield(future)
+
+
+    def outcome(self, status, message):
+        replies = Replies([message])
+        replies.status = status
+        return replies
+
+
+    def handle_request(self, s, data):
+        if data['reason'] == 'show_stat':
+            self.show_stat(s, self.object_index(data))
+        elif data['reason'] == 'show_all_stats':
+            self.show_all_stats(s, data.get('records', False))
+        elif data['reason'] == 'show_config':
+            self.show_config(s, self.object_index(data))
+        elif data['reason'] == 'show_all_configs':
+            self.show_all_configs(s)
+        elif data['reason'] == 'change_config':
+            self.change_config(s, self.object_index(data), data['payload'])
+        elif data['reason'] == 'add_object':
+            self.add_object(s, data['payload'])
+        elif data['reason'] == 'delete_object':
+            self.delete_object(s, self.object_index(data))
+        elif data['reason'] == 'show_crashes':
+            self.show_crashes(s)
+        elif data['reason'] == 'show_crash_info':
+            self.show_crash_info(s, data['payload'])
+        elif data['reason'] == 'clear_crash_logs':
+            self.clear_crash_logs(s)
+        elif data['reason'] == 'debug_log':
+            self.show_debug_log(s)
+        elif data['reason'] == 'show_executor_stats':
+            self.show_executor_stats(s)
         else:
-            return []
+            self.reply(s, f'Unknown reason {data["reason"]}', 'rejected')
+
+
+    def object_index(self, data):
+        """
+        Index of object of request, given by its LABEL or by index.
+        LABEL is resolved when request is executed, so it is the same object even if others have been added or deleted
+        """
+        if 'label' in data:
+            if data['label'] not in self.indexes:
+                raise ObjectNotFoundError(f'There is no object {data["label"]}')
+            return self.indexes[data['label']]
+
+        index = int(data['index'])
+        if not 0 <= index < len(self.objects):
+            raise ObjectNotFoundError(f'There is no object {index}')
+        return index
+
+
+    def reply(self, s, obj, status=None):
+        """ s is Replies of the request being handled, status is set when request has not been done """
+        s.append(obj)
+        if status is not None:
+            s.status = status
+
+
+    def get_stat(self, index, records=True):
+        return STATS_STORE.get(self.objects[index]['LABEL'], records)
 
 
     def get_config(self, index):
@@ -103,39 +259,46 @@ class CLIThread(threading.Thread):
         cfg['time'] = cfg['time_config']
         del cfg['time_config']
 
-        if "STATS" in cfg:
-            del cfg['STATS']
-
         return cfg
 
 
     def show_config(self, s, index):
-        s.sendall(util.prepare_object_to_sending(ENCODING, self.get_config(index)))
+        self.reply(s, self.get_config(index))
 
 
     def show_debug_log(self, s):
         self.debug_log = self.debug_log[::-1][:10:][::-1]
-        s.sendall(util.prepare_object_to_sending(ENCODING, self.debug_log))
+        self.reply(s, self.debug_log)
 
 
     def show_all_configs(self, s):
         configs = [self.get_config(i) for i in range(len(self.objects))]
-        data = util.prepare_object_to_sending(ENCODING, configs)
-        s.sendall(data)
+        self.reply(s, configs)
 
 
     def show_stat(self, s, index):
-        s.sendall(util.prepare_object_to_sending(ENCODING, self.get_stat(int(index))))
+        self.reply(s, self.get_stat(int(index)))
 
 
-    def show_all_stats(self, s):
-        stats = [self.get_stat(i) for i in range(len(self.objects))]
-        s.sendall(util.prepare_object_to_sending(ENCODING, stats))
+    def show_all_stats(self, s, records=False):
+        """ Aggregates of every object, records are sent only if asked """
+        stats = [self.get_stat(i, records) for i in range(len(self.objects))]
+        self.reply(s, stats)
+
+
+    def show_executor_stats(self, s):
+        stats = {'executor':EXECUTOR.stats(), 'browser_pool':BROWSER_POOL.stats()}
+        if EXECUTION_MODE == 'process':
+            stats['process_pool'] = PROCESS_POOL.stats()
+        else:
+            # in process mode every worker process has its own render cache
+            stats['render_cache'] = RENDER_CACHE.stats()
+        self.reply(s, stats)
 
 
     def show_crashes(self, s):
         crashes = [crash.split(CRASH_LOGS_FILE_FORMAT)[0] for crash in os.listdir(CRASH_LOGS_DIRECTORY)]
-        s.sendall(util.prepare_object_to_sending(ENCODING, crashes))
+        self.reply(s, crashes)
 
 
     def show_crash_info(self, s, filename):
@@ -143,7 +306,7 @@ class CLIThread(threading.Thread):
             crash_info = f.read()
             f.close()
 
-        s.sendall(util.prepare_object_to_sending(ENCODING, crash_info))
+        self.reply(s, crash_info)
 
 
     def clear_crash_logs(self, s):
@@ -151,36 +314,46 @@ class CLIThread(threading.Thread):
             if '.txt' in file:
                 os.remove(f'{CRASH_LOGS_DIRECTORY}/{file}')
 
-        s.sendall(util.prepare_object_to_sending(ENCODING, 'Successfully clened!'))
+        self.reply(s, 'Successfully clened!')
 
 
 
     def change_config(self, s, index, config):
 
+        if 'LABEL' in config:
+            config['LABEL'] = str(config['LABEL']).replace(' ', "_")
+
+        label = config.get('LABEL', self.objects[index]['LABEL'])
+        if label != self.objects[index]['LABEL'] and label in self.indexes:
+            self.reply(s, f'Object {label} already exists, LABEL must be unique', 'rejected')
+            return
+
+        for key in config:
+            if key not in ('time', 'remove'):
+                config[key] = self.parse_value(config[key])
+        self.check_object(dict(self.objects[index], **config))
+
         old_object_config = dict(self.objects[index])
         time = self.objects[index]['time']
+        warning = ''
 
         if 'time' in config:
             try:
-                time = util.set_time_conditions(config['time'])
+                time = compile_schedule(config['time'])
                 tm = config['time']
             except:
-                s.sendall(util.prepare_object_to_sending(ENCODING, 'Bad interpretation\n'))
+                warning = 'Bad interpretation of time\n'
                 del config['time']
 
         for obj in config:
+            # schedule is read by scheduler thread, object gets only the compiled one
+            if obj == 'time':
+                continue
+
             if obj == 'remove':
-                if config[obj] in self.objects[index]:
+                if config[obj] in self.objects[index] and config[obj] not in ('time', 'time_config'):
                     del self.objects[index][config[obj]]
                     continue
-            
-            if  type(config[obj]) == str:
-                if config[obj].isnumeric():
-                    config[obj] = int(config[obj])
-                elif config[obj].lower() == "false":
-                    config[obj] = 0
-                elif config[obj].lower() == "true":
-                    config[obj] = 1
 
             self.objects[index][obj] = config[obj]
 
@@ -195,8 +368,6 @@ class CLIThread(threading.Thread):
                 cfg['CHATS_OBJECTS'][index]['time'] = cfg['CHATS_OBJECTS'][index]['time_config']
 
             del cfg['CHATS_OBJECTS'][index]['time_config']
-            if 'STATS' in cfg['CHATS_OBJECTS'][index]:
-                del cfg['CHATS_OBJECTS'][index]['STATS']
 
             f = open(CONFIG_PATH, 'w')
             json.dump(cfg, f)
@@ -206,14 +377,24 @@ class CLIThread(threading.Thread):
                 self.objects[index]['time'] = time
                 self.objects[index]['time_config'] = tm
 
-            s.sendall(util.prepare_object_to_sending(ENCODING, 'Config has been successfully changed'))
+            self.reply(s, warning + 'Config has been successfully changed')
         except:
             self.objects[index] = dict(old_object_config)
-            s.sendall(util.prepare_object_to_sending(ENCODING, 'Bad interpretation'))
+            self.reply(s, 'Bad interpretation', 'rejected')
+
+        self.update_indexes()
+        self.scheduler.remove(old_object_config['LABEL'])
+        self.scheduler.add(self.objects[index])
+        DELIVERED_IMAGES.forget(old_object_config['LABEL'])
+        STATS_STORE.rename(old_object_config['LABEL'], self.objects[index]['LABEL'])
 
 
     def delete_object(self, s, index):
+        self.scheduler.remove(self.objects[index]['LABEL'])
+        DELIVERED_IMAGES.forget(self.objects[index]['LABEL'])
+        STATS_STORE.forget(self.objects[index]['LABEL'])
         del self.objects[index]
+        self.update_indexes()
 
         cfg, old_cfg = self.load_config()
 
@@ -222,13 +403,20 @@ class CLIThread(threading.Thread):
 
             self.dump_config(cfg)
 
-            s.sendall(util.prepare_object_to_sending(ENCODING, 'Object has been deleted'))
+            self.reply(s, 'Object has been deleted')
         except:
             self.dump_config(old_cfg)
+            self.reply(s, 'Bad interpretation, object hasn\'t been deleted from config', 'failed')
 
 
     def add_object(self, s, config):
 
+        config['LABEL'] = str(config['LABEL']).replace(' ', "_")
+        if config['LABEL'] in self.indexes:
+            self.reply(s, f'Object {config["LABEL"]} already exists, LABEL must be unique', 'rejected')
+            return
+        self.check_object(config)
+
         self.objects.append(config)
 
         cfg, old_cfg = self.load_config()
@@ -239,19 +427,43 @@ class CLIThread(threading.Thread):
             self.dump_config(cfg)
 
             self.objects[-1]['time_config'] = config['time']
-            self.objects[-1]['time'] = util.set_time_conditions(config['time'])
+            self.objects[-1]['time'] = compile_schedule(config['time'])
+            self.update_indexes()
+            self.scheduler.add(self.objects[-1])
 
-            s.sendall(util.prepare_object_to_sending(ENCODING, 'Object has been created'))
+            self.reply(s, 'Object has been created')
         except:
             self.dump_config(old_cfg)
             self.objects.pop()
-            s.sendall(util.prepare_object_to_sending(ENCODING, 'Bad interpretation, objects hasn\'t been added'))
+            self.update_indexes()
+            self.reply(s, 'Bad interpretation, objects hasn\'t been added', 'rejected')
+
+
+    @staticmethod
+    def parse_value(value):
+        """ Values set in cli are strings, numbers and booleans are converted """
+        if type(value) == str:
+            if value.isnumeric():
+                return int(value)
+            elif value.lower() == "false":
+                return 0
+            elif value.lower() == "true":
+                return 1
+        return value
+
+
+    @staticmethod
+    def check_object(config):
+        """ Raises ValueError for values which would fail every job of the object """
+        unchanged_mode = config.get('SKIP_UNCHANGED')
+        if unchanged_mode and unchanged_mode not in UNCHANGED_MODES:
+            raise ValueError(f'SKIP_UNCHANGED must be one of {", ".join(UNCHANGED_MODES)} or empty, not {unchanged_mode!r}')
 
 
     def load_config(self):
         f = open(CONFIG_PATH, 'r')
         cfg = json.load(f)
-        old_cfg = dict(cfg)
+        old_cfg = copy.deepcopy(cfg)
         f.close()
 
         return cfg, old_cfg
@@ -263,19 +475,12 @@ class CLIThread(threading.Thread):
         f.close()
 
 
-    def disconnect(self, s):
-        if s in self.outputs:
-            self.outputs.remove(s)
-        self.inputs.remove(s)
-
-        try:
-            s.shutdown(socket.SHUT_RDWR)
-            s.close()
-        except:
-            pass
-
     def quit(self):
-        self.sock.shutdown(socket.SHUT_RDWR)
-        self.sock.close()
-        exit()
-
+        def close():
+            self.server.close()
+            for task in asyncio.all_tasks(self.loop):
+                task.cancel()
+            # cancelled tasks finish on the next iteration of the loop
+            self.loop.call_soon(self.loop.stop)
+
+        self.loop.call_soon_threadsafe(close)
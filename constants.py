@@ -4,7 +4,8 @@ import json
 import shutil
 
 from datetime import datetime, timedelta
-from util import set_time_conditions, weekdays, check_arg
+from schedule import compile_schedule
+from util import weekdays, check_arg
 
 
 #CONFIG_PATH = 'config.json'
@@ -27,13 +28,47 @@ try:
 	CLI_IP = file['CLI']['CLI_IP']
 	CLI_PORT = file['CLI']['CLI_PORT']
 
+	ADMIN_HTTP = file.get('ADMIN_HTTP', {})
+	ADMIN_HTTP_IP = ADMIN_HTTP.get('IP', '127.0.0.1') # there is no authentication, keep it local
+	ADMIN_HTTP_PORT = ADMIN_HTTP.get('PORT') # disabled if not set
+
 	ENCODING = 'utf-8'
 
+	BROWSER_POOL = file.get('BROWSER_POOL', {})
+	BROWSER_POOL_SIZE = int(BROWSER_POOL.get('SIZE', 2))
+	BROWSER_MAX_RENDERS = int(BROWSER_POOL.get('MAX_RENDERS', 50))
+	BROWSER_MAX_RSS_MB = int(BROWSER_POOL.get('MAX_RSS_MB', 1500))
+
+	HTTP = file.get('HTTP', {})
+	HTTP_POOL_SIZE = int(HTTP.get('POOL_SIZE', 10))
+	HTTP_RETRIES = int(HTTP.get('RETRIES', 3))
+	HTTP_BACKOFF_FACTOR = float(HTTP.get('BACKOFF_FACTOR', 0.3))
+	HTTP_DEFAULT_TIMEOUT = float(HTTP.get('TIMEOUT', 10))
+	HTTP_ENDPOINT_TIMEOUTS = {'login':5, 'attachment/upload':30, 'chat/event/send':10}
+	HTTP_ENDPOINT_TIMEOUTS.update(HTTP.get('ENDPOINT_TIMEOUTS', {}))
+	ASYNC_UC_CONCURRENCY = int(HTTP.get('ASYNC_CONCURRENCY', 50))
+
+	EXECUTOR = file.get('EXECUTOR', {})
+	JOB_WORKERS = int(EXECUTOR.get('WORKERS', BROWSER_POOL_SIZE))
+	JOB_DEDUP_MODE = EXECUTOR.get('DEDUP', 'skip') # skip, coalesce
+	EXECUTION_MODE = EXECUTOR.get('MODE', 'thread') # thread, process
+	PROCESS_MAX_RSS_MB = int(EXECUTOR.get('PROCESS_MAX_RSS_MB', 2000))
+	PROCESS_MAX_JOBS = int(EXECUTOR.get('PROCESS_MAX_JOBS', 20))
+
+	RENDER = file.get('RENDER', {})
+	RENDER_PARALLEL_URLS = int(RENDER.get('PARALLEL_URLS', BROWSER_POOL_SIZE))
+	STITCH_MEMORY_MB = int(RENDER.get('STITCH_MEMORY_MB', 512))
+	MAX_IMAGE_HEIGHT = int(RENDER.get('MAX_IMAGE_HEIGHT', 8000)) # 0 - not split
+
+	RENDER_CACHE = file.get('RENDER_CACHE', {})
+	RENDER_CACHE_TTL = float(RENDER_CACHE.get('TTL', 30)) # 0 - disabled
+	REUSE_ATTACHMENTS = bool(RENDER_CACHE.get('REUSE_ATTACHMENTS', True))
+
 	file = list(file['CHATS_OBJECTS'])
 
 	for i in range(len(file)):
 		file[i]['time_config'] = str(file[i]['time'])
-		file[i]['time'] = set_time_conditions(file[i]['time'])
+		file[i]['time'] = compile_schedule(file[i]['time'])
 		file[i]['LABEL'] = file[i]['LABEL'].replace(' ', "_")
 		file[i]['GRAFANA'] = int(file[i]['GRAFANA'])
 except:
@@ -42,19 +77,68 @@ except:
 
 OBJECTS = list(file)
 
+# objects are identified by LABEL in scheduler, executor and stats
+_labels = [obj['LABEL'] for obj in OBJECTS]
+_duplicate_labels = sorted({label for label in _labels if _labels.count(label) > 1})
+if _duplicate_labels:
+	print(f'LABEL of every object must be unique, check {", ".join(_duplicate_labels)} in {CONFIG_PATH}')
+	sys.exit()
+
 
 GRAFANA_LOGIN_FIELD_XPATH = '//*[@id="reactRoot"]/div/main/div[3]/div/div[2]/div/div/form/div[1]/div[2]/div/div/input'
 GRAFANA_PASSWORD_FIELD_XPATH = '//*[@id="current-password"]'
 GRAFANA_LOGIN_BUTTON_XPATH = '//*[@id="reactRoot"]/div/main/div[3]/div/div[2]/div/div/form/button'
 
+DEFAULT_RENDERER = 'selenium' # selenium, grafana_api
+GRAFANA_RENDER_WIDTH = 1920
+GRAFANA_RENDER_HEIGHT = 1080
+GRAFANA_RENDER_TIMEOUT_MARGIN = 10
+
+PAGE_NETWORK_IDLE_TIME = 0.5
+PAGE_READY_POLL_INTERVAL = 0.1
+PAGE_SCROLL_READY_TIMEOUT = 3
+
 
 SCREENSHOTPATH = '.'
 SCREENSHOTFILENAME = 'scrn.png'
 SCREENSHOTFILETYPE = 'image/png'
+IMAGE_MEDIUM_SIZE = 300   # 'm' size, longest side
+IMAGE_PREVIEW_SIZE = 40   # inline thumbnail of the message, longest side
+# zlib levels of png: on 1920x4000 dashboard level 9 is 5 times slower than 6 for 2% smaller file,
+# levels below 6 save little time for 10-15% bigger file. Small variants are compressed fully, it takes milliseconds
+PNG_COMPRESS_LEVEL = 6
+MEDIUM_COMPRESS_LEVEL = 9
+PREVIEW_COMPRESS_LEVEL = 9
+IMAGE_FORMATS = {'png':{'format':'PNG', 'mimetype':'image/png'},
+                 'jpeg':{'format':'JPEG', 'mimetype':'image/jpeg'},
+                 'webp':{'format':'WEBP', 'mimetype':'image/webp'}}
+DEFAULT_IMAGE_FORMAT = 'png'
+IMAGE_QUALITY = 85   # jpeg, webp
+IMAGE_COLORS = 0     # png palette size, 0 - no quantization
+UNCHANGED_SIGNATURE_SIZE = 32
+UNCHANGED_HASH_THRESHOLD = 4         # differing bits of 64 bit perceptual hash
+UNCHANGED_SIGNATURE_THRESHOLD = 2.0  # mean pixel difference of signatures, of 255
+UNCHANGED_TEXT = 'Nothing has changed since the last image'
+UNCHANGED_MODES = ('skip', 'text')
+UC_SESSION_EXPIRED_CODES = [401]
+CHAT_SEND_PARALLEL = 10
+CHAT_SEND_BATCH_SIZE = 1
 CRASH_LOGS_DIRECTORY = '/var/log/monitoring_bot/crash_logs' #'crash_logs'
 CRASH_LOGS_FILE_FORMAT = '.txt'
-STATS_LIMIT = 5
+STATS_LIMIT = 100 # jobs kept in stats of every object
+SCHEDULER_MAX_SLEEP = 60
+CLI_MAX_FRAME_SIZE = 64 * 2**20
+CLI_REQUEST_TIMEOUT = 30
+CLI_WRITE_TIMEOUT = 30
+CLI_WRITE_BUFFER_LIMIT = 2**20
+CLI_SUBSCRIBER_QUEUE_SIZE = 1000
 
 STOP_PROGRAMM_AFTER_CRASH = check_arg(['--stop-after-crash'], sys.argv, return_result=False)
 
 LOG_HTTP_TRAFFIC = False
+
+# true (or 1 set by cli) is not a mode, it would fail every job of the object
+_bad_unchanged_modes = [obj['LABEL'] for obj in OBJECTS if obj.get('SKIP_UNCHANGED') and obj['SKIP_UNCHANGED'] not in UNCHANGED_MODES]
+if _bad_unchanged_modes:
+	print(f'SKIP_UNCHANGED must be one of {", ".join(UNCHANGED_MODES)} or empty, check {", ".join(_bad_unchanged_modes)} in {CONFIG_PATH}')
+	sys.exit()
@@ -0,0 +1,118 @@
+import threading
+
+from constants import *
+from util import print_if_debug
+from page_readiness import wait_until_ready
+from urllib.parse import urlsplit
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+
+GRAFANA_LOGIN_ATTEMPTS = 5
+
+
+def grafana_base_url(url):
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}'
+
+
+def grafana_login_form_present(driver):
+    """ Checked when page is ready, so nothing is waited for (logged in page has no form to wait) """
+    try:
+        return any(field.is_displayed() for field in driver.find_elements(By.XPATH, GRAFANA_LOGIN_FIELD_XPATH))
+    except Exception:
+        return False
+
+
+def login_to_grafana(driver, username, password):
+    WebDriverWait(driver=driver, timeout=10).until(EC.presence_of_element_located((By.XPATH, GRAFANA_LOGIN_FIELD_XPATH)))
+    driver.find_element(By.XPATH, GRAFANA_LOGIN_FIELD_XPATH).send_keys(username)
+    driver.find_element(By.XPATH, GRAFANA_PASSWORD_FIELD_XPATH).send_keys(password)
+    driver.find_element(By.XPATH, GRAFANA_LOGIN_BUTTON_XPATH).click()
+    WebDriverWait(driver=driver, timeout=10).until(EC.invisibility_of_element_located((By.XPATH, GRAFANA_LOGIN_FIELD_XPATH)))
+
+
+class GrafanaAuthCache:
+    """
+    Grafana session cookies keyed by (GRAFANA_LOGIN, base url).
+    Cookies are injected into drivers which haven't got them yet, login is done only when login form is shown.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cookies = {}
+
+
+    def key(self, url, grafana):
+        return (grafana['LOGIN'], grafana_base_url(url))
+
+
+    def prepare(self, driver, key):
+        with self.lock:
+            cookies = self.cookies.get(key)
+
+        if not cookies or key in self.driver_keys(driver):
+            return
+
+        # cookies can be set only for the domain which is currently opened
+        driver.get(f'{key[1]}/robots.txt')
+        for cookie in cookies:
+            try:
+                driver.add_cookie(cookie)
+            except Exception:
+                continue
+
+        self.driver_keys(driver).add(key)
+
+
+    def driver_keys(self, driver):
+        """ Grafana sessions which cookies are already set in driver """
+        if not hasattr(driver, 'grafana_keys'):
+            driver.grafana_keys = set()
+        return driver.grafana_keys
+
+
+    def store(self, driver, key):
+        cookies = [{k:v for k, v in cookie.items() if k in ('name', 'value', 'path', 'secure', 'httpOnly', 'expiry')}
+                   for cookie in driver.get_cookies()]
+
+        with self.lock:
+            self.cookies[key] = cookies
+        self.driver_keys(driver).add(key)
+
+
+    def invalidate(self, key):
+        with self.lock:
+            self.cookies.pop(key, None)
+
+
+    def open(self, driver, url, grafana, timeout):
+        """ Opens url in driver being logged into grafana and waits until it is ready (see wait_until_ready) """
+        key = self.key(url, grafana)
+        self.prepare(driver, key)
+        driver.get(url)
+        wait_until_ready(driver, timeout)
+
+        attempts = GRAFANA_LOGIN_ATTEMPTS
+        while grafana_login_form_present(driver):
+            self.driver_keys(driver).discard(key)
+            if attempts <= 0:
+                self.invalidate(key)
+                raise TimeoutError(f'All {GRAFANA_LOGIN_ATTEMPTS} attempts of login to grafana were not successfull')
+
+            print_if_debug(f'Logging into grafana {key[1]} as {key[0]}', 'full')
+            try:
+                login_to_grafana(driver=driver, username=grafana['LOGIN'], password=grafana['PASSWORD'])
+            except Exception:
+                pass
+            attempts -= 1
+
+            if not grafana_login_form_present(driver):
+                self.store(driver, key)
+                # grafana redirects to home page after login
+                driver.get(url)
+                wait_until_ready(driver, timeout)
+
+
+GRAFANA_AUTH = GrafanaAuthCache()
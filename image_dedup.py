@@ -0,0 +1,70 @@
+import threading
+
+from PIL import Image
+from constants import UNCHANGED_SIGNATURE_SIZE, UNCHANGED_HASH_THRESHOLD, UNCHANGED_SIGNATURE_THRESHOLD
+
+
+def fingerprint(img):
+    """
+    Returns (perceptual hash, signature) of image:
+    signature is grayscale image downscaled to UNCHANGED_SIGNATURE_SIZE, hash is 64 bit difference hash of it
+    """
+    signature = img.resize((UNCHANGED_SIGNATURE_SIZE, UNCHANGED_SIGNATURE_SIZE), Image.BOX, reducing_gap=2.0).convert('L')
+
+    pixels = list(signature.resize((9, 8), Image.BOX).getdata())
+    image_hash = 0
+    for row in range(8):
+        for column in range(8):
+            image_hash = (image_hash << 1) | (pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+
+    return image_hash, signature.tobytes()
+
+
+def is_unchanged(old, new, hash_threshold=UNCHANGED_HASH_THRESHOLD, signature_threshold=UNCHANGED_SIGNATURE_THRESHOLD):
+    """
+    Images are effectively identical when hashes differ in at most hash_threshold bits
+    and mean difference of signature pixels is at most signature_threshold (of 255)
+    """
+    if old is None or new is None or len(old[1]) != len(new[1]):
+        return False
+
+    if bin(old[0] ^ new[0]).count('1') > hash_threshold:
+        return False
+
+    difference = sum(abs(a - b) for a, b in zip(old[1], new[1])) / len(new[1])
+    return difference <= signature_threshold
+
+
+def images_unchanged(old, new, hash_threshold=UNCHANGED_HASH_THRESHOLD, signature_threshold=UNCHANGED_SIGNATURE_THRESHOLD):
+    """ Same as is_unchanged for lists of fingerprints of images split from one screenshot """
+    if old is None or new is None or len(old) != len(new):
+        return False
+    return all(is_unchanged(a, b, hash_threshold, signature_threshold) for a, b in zip(old, new))
+
+
+class DeliveredImages:
+    """ Fingerprints of the last images delivered by objects, keyed by object LABEL """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fingerprints = {}
+
+
+    def peek(self, label):
+        with self.lock:
+            return self.fingerprints.get(label)
+
+
+    def seed(self, label, image_fingerprint):
+        if image_fingerprint is None:
+            return
+        with self.lock:
+            self.fingerprints[label] = image_fingerprint
+
+
+    def forget(self, label):
+        with self.lock:
+            self.fingerprints.pop(label, None)
+
+
+DELIVERED_IMAGES = DeliveredImages()
@@ -0,0 +1,79 @@
+"""
+Events of object jobs: started, rendered, uploaded, sent, skipped, then finished or failed.
+Event is a dict {'time', 'job', 'object', 'index', 'phase', ...phase fields}, listeners are called in the thread of the job.
+In worker process events are collected and published by the main process when the job is done.
+"""
+import os
+import time
+import itertools
+import threading
+
+
+_listeners = []
+_lock = threading.Lock()
+_local = threading.local()
+_counter = itertools.count()
+_collected = None
+
+
+def add_listener(listener):
+    with _lock:
+        _listeners.append(listener)
+
+
+def remove_listener(listener):
+    with _lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+def publish(event):
+    if _collected is not None:
+        _collected.append(event)
+        return
+
+    with _lock:
+        listeners = list(_listeners)
+
+    for listener in listeners:
+        try:
+            listener(event)
+        except Exception as e:
+            print(f'Job event listener has failed: {e!r}')
+
+
+def start_job(label, index):
+    """ Starts job of object in current thread, following events of the thread belong to it """
+    _local.job = {'id':f'{os.getpid()}-{next(_counter)}', 'object':label, 'index':index, 'started':time.monotonic()}
+    emit('started')
+
+
+def emit(phase, **fields):
+    job = getattr(_local, 'job', None)
+    if job is None:
+        return
+
+    event = {'time':time.time(), 'job':job['id'], 'object':job['object'], 'index':job['index'], 'phase':phase}
+    event.update(fields)
+    publish(event)
+
+
+def finish_job(phase='finished', **fields):
+    """ Emits the last event of the job (finished or failed) with its total duration """
+    job = getattr(_local, 'job', None)
+    if job is None:
+        return
+
+    emit(phase, seconds=time.monotonic() - job['started'], **fields)
+    _local.job = None
+
+
+def start_collecting():
+    global _collected
+    _collected = []
+
+
+def stop_collecting():
+    global _collected
+    events, _collected = _collected or [], None
+    return events
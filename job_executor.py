@@ -0,0 +1,116 @@
+import queue
+import itertools
+import threading
+
+from constants import *
+from util import print_if_debug
+from crash_logging import crash_logging
+
+
+class JobExecutor:
+    """
+    Bounded pool of worker threads taking jobs from priority queue (higher priority goes first).
+    Jobs are deduplicated by key: job which is already waiting in queue gets the newest arguments,
+    job which is running is skipped or coalesced into one rerun after it finishes (dedup='skip' or 'coalesce').
+    """
+
+    def __init__(self, workers=JOB_WORKERS, dedup=JOB_DEDUP_MODE):
+        self.workers = workers
+        self.dedup = dedup
+
+        self.queue = queue.PriorityQueue()
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+        self.threads = []
+
+        self.jobs = {}      # key -> (fn, args) of queued job
+        self.running = {}   # key -> (fn, args) of running job
+        self.pending = {}   # key -> (priority, fn, args) of job to be run after running one
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.coalesced = 0
+
+
+    def start(self):
+        with self.lock:
+            while len(self.threads) < self.workers:
+                thread = threading.Thread(target=self.worker, name=f'job-worker-{len(self.threads)}', daemon=True)
+                self.threads.append(thread)
+                thread.start()
+
+
+    def submit(self, key, fn, args=(), priority=0):
+        """ Returns False if job was skipped due to deduplication """
+        if not self.threads:
+            self.start()
+
+        with self.lock:
+            self.submitted += 1
+
+            if key in self.jobs:
+                self.jobs[key] = (fn, args)
+                self.coalesced += 1
+                return True
+
+            if key in self.running:
+                if self.dedup == 'coalesce':
+                    self.pending[key] = (priority, fn, args)
+                    self.coalesced += 1
+                    return True
+
+                self.skipped += 1
+                print_if_debug(f'{key} is still running, skipping new run', 'full')
+                return False
+
+            self.enqueue(key, fn, args, priority)
+            return True
+
+
+    def enqueue(self, key, fn, args, priority):
+        self.jobs[key] = (fn, args)
+        self.queue.put((-priority, next(self.counter), key))
+
+
+    def worker(self):
+        while True:
+            _, _, key = self.queue.get()
+
+            with self.lock:
+                fn, args = self.jobs.pop(key)
+                self.running[key] = (fn, args)
+
+            try:
+                fn(*args)
+                failed = False
+            except Exception:
+                crash_logging(addition_string=f'Job {key} failed')
+                failed = True
+
+            with self.lock:
+                del self.running[key]
+                if failed:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+
+                if key in self.pending:
+                    priority, fn, args = self.pending.pop(key)
+                    self.enqueue(key, fn, args, priority)
+
+
+    def is_busy(self, key):
+        with self.lock:
+            return key in self.jobs or key in self.running
+
+
+    def stats(self):
+        with self.lock:
+            return {'workers':self.workers, 'dedup':self.dedup, 'queued':len(self.jobs), 'running':sorted(self.running),
+                    'pending':sorted(self.pending), 'submitted':self.submitted, 'completed':self.completed,
+                    'failed':self.failed, 'skipped':self.skipped, 'coalesced':self.coalesced}
+
+
+EXECUTOR = JobExecutor()
@@ -1,70 +1,191 @@
-"""!!!!!!!!!!!!!!!!!!!!!1 Модуль НЕ используется !!!!!!!!!!!!!!!!!!!!!!!!!!"""
-import queue
+"""Асинхронный клиент uc-access-layer-web на aiohttp"""
+import os
+import random
 import asyncio
 import aiohttp
 import logging
 import threading
 
-from configs.config import IP_UC_ACCESS_LAYER_WEB, PORT_UC_ACCESS_LAYER_WEB
+from libs.utils import ResponseDict
+from constants import HTTP_POOL_SIZE, ASYNC_UC_CONCURRENCY
+from libs.net.session_pool import endpoint_timeout
+from models.uc_api.uc_api_models import GeneralRequest, GeneralResponse, GeneralError, ChatEventResponse, LoginRequest
 
 logger = logging.getLogger()
 
 __author__ = 'Dmitriy Minor'
-__all__ = ['http_con', 'HttpClient']
+__all__ = ['AsyncUcClient', 'AsyncLoopThread', 'UC_CLIENT', 'run_async']
 
 
-def http_con(name: str, ip: str = IP_UC_ACCESS_LAYER_WEB, port: int = PORT_UC_ACCESS_LAYER_WEB):
-    """
-    :param ip: IP адресс сервиса uc-access-layer-web
-    :param port: Порт сервиса uc-access-layer-web
-    :param name: имя пользователя, который производит подключение к WS
-    """
-    request_queue = queue.Queue()
-    response_queue = queue.Queue()
-    client = HttpClient(request_queue=request_queue, response_queue=response_queue, name=name)
-    client.setDaemon(True)
-    client.start()
-    return client
+def error_model(body):
+    """ GeneralError из тела ответа с ошибкой или None, если тело не в формате UC (например, страница ошибки прокси) """
+    if not body:
+        return None
+    try:
+        return GeneralError(**body)
+    except ValueError:
+        return None
 
 
-class HttpClient(threading.Thread):
+class AsyncUcClient:
     """
-    :param request: URL по которому осуществляется соединение с WS
-    :param request_queue: очередь с тасками, в которой хранятся сообщения для отправки
-    :param response_queue: очередь в которую складываются ответы на запросы
-    :param name: имя пользователя, который производит подключение к WS
+    Клиент uc-access-layer-web с общей aiohttp.ClientSession
+    :param limit: максимальное количество одновременных запросов
     """
 
-    def __init__(self, request_queue, response_queue, name):
-        threading.Thread.__init__(self)
-        self.request_queue = request_queue
-        self.response_queue = response_queue
-        self.name = name
+    def __init__(self, limit: int = ASYNC_UC_CONCURRENCY):
+        self.limit = limit
+        self.session = None
+        self.semaphore = None
 
-    def run(self):
-        asyncio.run(self.main(), debug=True)
+    async def start(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=HTTP_POOL_SIZE)
+            self.session = aiohttp.ClientSession(connector=connector)
+            self.semaphore = asyncio.Semaphore(self.limit)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _post(self, ip, port, endpoint, data=None, headers=None, timeout=None):
+        await self.start()
+        url = f"http://{ip}:{port}/uc/v2/{endpoint}"
+        client_timeout = aiohttp.ClientTimeout(total=endpoint_timeout(url, timeout))
+
+        async with self.semaphore:
+            async with self.session.post(url, data=data, headers=headers, timeout=client_timeout) as response:
+                try:
+                    body = await response.json(content_type=None)
+                except Exception:
+                    body = None
+                # тело ответа UC - всегда json объект
+                return response, body if isinstance(body, dict) else None
+
+    async def send_request(self, ip, port, endpoint, payload=None, session_id=None, timeout=None):
+        """
+        Отправляет запрос в формате GeneralRequest
+        :param endpoint: конечная точка URL
+        :param payload: тело запроса
+        :param session_id: Уникальный ID сессии
+        """
+        request_model = GeneralRequest(method=endpoint, id=random.randrange(11111, 99999), payload=payload)
+        headers = {'Content-Type': 'application/json'}
+        if session_id is not None:
+            headers['protei-uc-sessionid'] = session_id
+
+        response, body = await self._post(ip, port, endpoint, data=request_model.json(by_alias=True, exclude_none=True),
+                                          headers=headers, timeout=timeout)
+
+        body = body or {}
+        data = None
+        if 200 <= response.status < 300 and body:
+            data = GeneralResponse(**body)
+        elif response.status >= 400:
+            data = error_model(body)
+        return ResponseDict({"headers": response.headers, "data": data, "payload": body.get("payload", None),
+                             "status_code": response.status})
+
+    async def login(self, ip, port, user, password):
+        """ Cборка запроса login, возвращает (protei-uc-sessionid, user_id) """
+        response = await self.send_request(ip, port, "login", payload=LoginRequest(login=user, password=password))
+        try:
+            return response.headers['protei-uc-sessionid'], int(response.payload['user_id'])
+        except Exception:
+            raise RuntimeError(f'Cannot login to UC, smth wrong\n{response.headers} {response.status_code}')
+
+    async def upload_file(self, ip, port, session_id, data, filename, file_type, mediasize=None, attachment_id=None):
+        """
+        Cборка запроса /attachment/upload, возвращает (ResponseDict, размер файла)
+        :param data: содержимое файла (bytes, memoryview или file-like объект)
+        """
+        headers = {'Content-type': file_type, 'protei-uc-sessionid': session_id, 'protei-uc-filename': filename}
+        if mediasize is not None:
+            headers['protei-uc-mediasize'] = mediasize
+            headers['protei-uc-attachmentid'] = attachment_id
+
+        if isinstance(data, memoryview):
+            size = data.nbytes
+        elif isinstance(data, (bytes, bytearray)):
+            size = len(data)
+        else:
+            position = data.tell()
+            size = data.seek(0, os.SEEK_END) - position
+            data.seek(position)
+
+        response, body = await self._post(ip, port, "attachment/upload", data=data, headers=headers)
+
+        response_dict = ResponseDict({"headers": response.headers, "status_code": response.status})
+        if response.status >= 400 and body:
+            response_dict.data = error_model(body)
+            response_dict.payload = body.get("payload", None)
+        return response_dict, size
 
-    async def main(self):
-        async with aiohttp.ClientSession() as client:
-            while True:
+    async def group_chat_event_send(self, ip, port, session_id, events):
+        """ Cборка запроса /chat/event/send """
+        response = await self.send_request(ip, port, "chat/event/send", payload=events, session_id=session_id)
+        if response.status_code == 200 or response.status_code == 206:
+            response.payload = ChatEventResponse(**response.payload)
+        return response
+
+    async def send_events(self, ip, port, session_id, events, batch_size=1, parallel=10):
+        """
+        Отправляет события пачками по batch_size в один chat/event/send, не более parallel запросов одновременно
+        :return: список (событие, status code, описание ошибки или None) в порядке событий
+        """
+        semaphore = asyncio.Semaphore(parallel)
+
+        async def send_batch(batch):
+            async with semaphore:
                 try:
-                    request = self.request_queue.get_nowait()
-                    if request == "Close WS":
-                        logger.info(f"{self.name} closed HTTP connection")
-                        await client.close()
-                        break
-                    async with client.post(url=request["url"], headers=request["headers"],
-                                           data=request["data"]) as response:
-                        body = await response.json()
-                        response_dict = ResponseDict({"headers": response.headers, "data": body,
-                                                      "payload": body.get("payload", None),
-                                                      "status_code": response.status, "name": self.name})
-                        self.response_queue.put(response_dict)
-                except queue.Empty:
-                    await asyncio.sleep(0.1)
-
-
-class ResponseDict(dict):
-    __getattr__ = dict.get
-    __setattr__ = dict.__setitem__
-    __delattr__ = dict.__delitem__
\ No newline at end of file
+                    response = await self.group_chat_event_send(ip, port, session_id, batch)
+                except Exception as error:
+                    logger.error(f"Error: {error}")
+                    return [(event, None, str(error)) for event in batch]
+
+            failed = {}
+            if isinstance(response.payload, ChatEventResponse) and response.payload.failed_events:
+                failed = {event.uuid.__root__: event.reason for event in response.payload.failed_events}
+
+            results = []
+            for event in batch:
+                if response.status_code not in (200, 206):
+                    results.append((event, response.status_code, f"status code {response.status_code}"))
+                else:
+                    results.append((event, response.status_code, failed.get(event.uuid)))
+            return results
+
+        batches = [events[i:i + batch_size] for i in range(0, len(events), batch_size)]
+        results = await asyncio.gather(*[send_batch(batch) for batch in batches])
+        return [result for batch_results in results for result in batch_results]
+
+
+class AsyncLoopThread(threading.Thread):
+    """ Поток с event loop-ом, в котором выполняются корутины из синхронного кода """
+
+    def __init__(self):
+        threading.Thread.__init__(self, name='uc-async-loop', daemon=True)
+        self.loop = asyncio.new_event_loop()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run_coroutine(self, coro, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout=timeout)
+
+
+UC_CLIENT = AsyncUcClient()
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+
+def run_async(coro, timeout=None):
+    """ Выполняет корутину в общем event loop-е и возвращает ее результат """
+    global _loop_thread
+    with _loop_lock:
+        if _loop_thread is None:
+            _loop_thread = AsyncLoopThread()
+            _loop_thread.start()
+    return _loop_thread.run_coroutine(coro, timeout=timeout)
@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 
+import io
+import os
 import urllib3
 import logging
 
 from typing import Any
-from requests import post, get
 from libs.utils import ResponseDict
+from libs.net.session_pool import get_session, endpoint_timeout
 from libs.utils import log_http_request
 from constants import LOG_HTTP_TRAFFIC
 from models.uc_api.uc_api_models import GeneralResponse, GeneralError
@@ -17,17 +19,66 @@ def __make_cookies_header(cookies):
     return ';'.join([x + '=' + cookies[x] for x in cookies])
 
 
+class _MemoryReader(io.RawIOBase):
+    """ Seekable file-like обертка над bytearray/memoryview, requests отправляет ее блоками без копирования всего буфера """
+
+    def __init__(self, buffer):
+        self.view = memoryview(buffer).cast('B')
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        size = min(len(b), len(self.view) - self.position)
+        b[:size] = self.view[self.position:self.position + size]
+        self.position += size
+        return size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: len(self.view)}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+
+def _open_upload(files):
+    """
+    Body of uploaded file without reading it into memory
+    :param files: path, bytes/memoryview or file-like object (read from current position)
+    :return: (body, size, opened file which should be closed or None)
+    """
+    if isinstance(files, (str, os.PathLike)):
+        opened_file = open(files, 'rb')
+        return opened_file, os.fstat(opened_file.fileno()).st_size, opened_file
+    if isinstance(files, bytes):
+        return files, len(files), None
+    if isinstance(files, (bytearray, memoryview)):
+        reader = _MemoryReader(files)
+        return reader, len(reader.view), None
+
+    position = files.tell()
+    size = files.seek(0, os.SEEK_END) - position
+    files.seek(position)
+    return files, size, None
+
+
 def http_post_request(url: str, data: Any = None, files=None, filename=None, file_type=None, params: dict = None,
                       headers: dict = None, cookies: dict = None, mediasize=None, attachment_id: str = None,
-                      timeout: int = 3, url_attach: str = None):
+                      timeout: int = None, url_attach: str = None):
     """
     Send http POST request
     :param url_attach: Ссылка на аттачь
     :param attachment_id: ID вложения
     :param file_type: Тип файла
     :param filename: Имя файла для загрузки
-    :param files: Файл для загрузки
-    :param timeout: тайм-аут ожидания ответа
+    :param files: Файл для загрузки: путь, bytes/memoryview или file-like объект, передается потоком
+    :param timeout: тайм-аут ожидания ответа, по умолчанию берется из настроек endpoint-а
     :param url: Server url without http prefix
     :param data: (optional) Dictionary, list of tuples, bytes, or file-like object to send in the body of the :class:`Request`.
     :param params: (optional) Params to urlencode
@@ -43,32 +94,31 @@ def http_post_request(url: str, data: Any = None, files=None, filename=None, fil
         }
 
     upload_file = {}
+    opened_file = None
 
     if cookies is not None:
         headers = {'Content-type': 'application/json', 'protei-uc-sessionid': cookies}
     if filename is not None:
         headers = {'Content-type': file_type, 'protei-uc-sessionid': cookies, 'protei-uc-filename': filename}
-        upload_file = open(files, 'rb')
-        data_file = upload_file.read()
         data = None
     if mediasize is not None:
         headers = {'Content-type': file_type, 'protei-uc-sessionid': cookies, 'protei-uc-filename': filename,
                    'protei-uc-mediasize': mediasize, 'protei-uc-attachmentid': attachment_id}
-        upload_file = open(files, 'rb')
-        data_file = upload_file.read()
         data = None
     if url_attach is not None:
         headers = {'Content-type': file_type, 'Protei-Uc-Sessionid': cookies, 'protei-uc-filename': filename,
                    'protei-uc-mediaremoteurl': url_attach, "protei-uc-mediasize": mediasize}
-        upload_file = open(files, 'rb')
-        data_file = upload_file.read()
         data = None
+    if data is None:
+        data_file, file_size, opened_file = _open_upload(files)
 
     __request_url = f"http://{url}"
+    session = get_session(__request_url)
+    timeout = endpoint_timeout(url, timeout)
 
     try:
         if data is not None:
-            response = post(url=__request_url, data=data.json(by_alias=True, exclude_none=True), params=params, headers=headers, timeout=timeout, files=upload_file)
+            response = session.post(url=__request_url, data=data.json(by_alias=True, exclude_none=True), params=params, headers=headers, timeout=timeout, files=upload_file)
             if 400 <= response.status_code <= 500:
                 response_id = GeneralError(**response.json()).id
                 response_dict = ResponseDict({"headers": response.headers, "data": GeneralError(**response.json()),
@@ -82,14 +132,14 @@ def http_post_request(url: str, data: Any = None, files=None, filename=None, fil
             request_id = data.id
             assert request_id == response_id
         else:
-            response = post(url=__request_url, data=data_file, params=params, headers=headers, timeout=timeout)
+            response = session.post(url=__request_url, data=data_file, params=params, headers=headers, timeout=timeout)
             if 400 <= response.status_code <= 500:
                 response_dict = ResponseDict({"headers": response.headers, "data": GeneralError(**response.json()),
                                               "payload": response.json().get("payload", None),
                                               "status_code": response.status_code})
             else:
                 response_dict = ResponseDict({"headers": response.headers, "status_code": response.status_code})
-                return response_dict, int(response.request.headers["Content-Length"])
+                return response_dict, file_size
 
     except urllib3.exceptions.ConnectTimeoutError as e:
         logger.error(f"Error: {e}")
@@ -97,6 +147,9 @@ def http_post_request(url: str, data: Any = None, files=None, filename=None, fil
     except Exception as error:
         logger.error(f"Error: {error}")
         raise
+    finally:
+        if opened_file is not None:
+            opened_file.close()
 
     if LOG_HTTP_TRAFFIC:
         log_http_request(logger, response, data)
@@ -105,7 +158,7 @@ def http_post_request(url: str, data: Any = None, files=None, filename=None, fil
 
 
 def http_get_request(url: str, headers: dict = None, cookies: dict = None, attachment_id: str = None, data=None,
-                     mediasize=None, timeout: int = 3, stream = None):
+                     mediasize=None, timeout: int = None, stream = None):
     """
     Send http GET request
     :param url: Server url without http prefix
@@ -123,10 +176,12 @@ def http_get_request(url: str, headers: dict = None, cookies: dict = None, attac
                    'protei-uc-attachmentid': attachment_id}
 
     __request_url = f"http://{url}"
+    session = get_session(__request_url)
+    timeout = endpoint_timeout(url, timeout)
 
     try:
         if headers.get("protei-uc-attachmentid"):
-            with get(url=__request_url, headers=headers, stream=True) as response:
+            with session.get(url=__request_url, headers=headers, stream=True, timeout=timeout) as response:
                 if 400 <= response.status_code <= 500:
                     response_dict = ResponseDict({"headers": response.headers, "data": GeneralError(**response.json()),
                                                   "payload": response.json().get("payload", None),
@@ -151,7 +206,7 @@ def http_get_request(url: str, headers: dict = None, cookies: dict = None, attac
             headers = {"Upgrade": "websocket", "Connection": "Upgrade", "Sec-WebSocket-Key": "eS6wH8nUyl8u1UMACnizuw==",
                        "Sec-WebSocket-Version": "13", "Content-Type": "application/json",
                        "Sec-WebSocket-Extensions": "permessage-deflate; client_max_window_bits"}
-            response = get(url=__request_url, headers=headers, data=data, timeout=timeout, stream=stream)
+            response = session.get(url=__request_url, headers=headers, data=data, timeout=timeout, stream=stream)
 
             if 400 <= response.status_code <= 500:
                 response_dict = ResponseDict({"headers": response.headers, "data": GeneralError(**response.json()),
@@ -0,0 +1,64 @@
+"""Пул keep-alive HTTP сессий, одна сессия на хост"""
+import threading
+
+from requests import Session
+from urllib.parse import urlsplit
+from urllib3.util.retry import Retry
+from requests.adapters import HTTPAdapter
+from constants import HTTP_POOL_SIZE, HTTP_RETRIES, HTTP_BACKOFF_FACTOR, HTTP_DEFAULT_TIMEOUT, HTTP_ENDPOINT_TIMEOUTS
+
+__all__ = ['get_session', 'endpoint_timeout', 'close_sessions']
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def _host(url: str):
+    if '://' not in url:
+        url = f"http://{url}"
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _new_session():
+    # POST is not idempotent: it is retried only when connection was not established
+    retry = Retry(total=HTTP_RETRIES, connect=HTTP_RETRIES, read=0, status=HTTP_RETRIES, backoff_factor=HTTP_BACKOFF_FACTOR,
+                  status_forcelist=[502, 503, 504], allowed_methods=frozenset(['GET']), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+
+    session = Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session(url: str):
+    """
+    Возвращает keep-alive сессию для хоста из url
+    :param url: Server url with or without http prefix
+    """
+    host = _host(url)
+    with _lock:
+        if host not in _sessions:
+            _sessions[host] = _new_session()
+        return _sessions[host]
+
+
+def endpoint_timeout(url: str, timeout=None):
+    """
+    Тайм-аут запроса: явно заданный или настроенный для endpoint-а (часть url после /uc/v2/)
+    :param url: Server url
+    :param timeout: Явно заданный тайм-аут
+    """
+    if timeout is not None:
+        return timeout
+
+    endpoint = url.split('/uc/v2/', 1)[-1].split('?')[0]
+    return HTTP_ENDPOINT_TIMEOUTS.get(endpoint, HTTP_DEFAULT_TIMEOUT)
+
+
+def close_sessions():
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
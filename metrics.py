@@ -0,0 +1,130 @@
+import math
+import threading
+
+import job_events
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+
+    def inc(self, *labels, value=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + value
+
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f'{self.name}{format_labels(self.labels, labels)} {format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, buckets, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = sorted(buckets) + [math.inf]
+        self.lock = threading.Lock()
+        self.values = {}   # labels -> [bucket counts, sum, count]
+
+
+    def observe(self, *labels, value):
+        with self.lock:
+            counts, total, count = self.values.get(labels) or ([0] * len(self.buckets), 0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[labels] = (counts, total + value, count + 1)
+
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            for labels, (counts, total, count) in sorted(self.values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    bucket_labels = format_labels(self.labels + ('le',), labels + (format_value(bound),))
+                    lines.append(f'{self.name}_bucket{bucket_labels} {bucket_count}')
+                lines.append(f'{self.name}_sum{format_labels(self.labels, labels)} {format_value(total)}')
+                lines.append(f'{self.name}_count{format_labels(self.labels, labels)} {count}')
+        return lines
+
+
+class Gauge:
+    """ Value is taken by fn() when metrics are rendered: number or {labels tuple: number} """
+
+    def __init__(self, name, help, fn, labels=()):
+        self.name, self.help, self.labels, self.fn = name, help, tuple(labels), fn
+
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{format_labels(self.labels, labels)} {format_value(value)}')
+        return lines
+
+
+class Metrics:
+    """ Metrics of the bot in Prometheus text format, job metrics are collected from job events """
+
+    def __init__(self):
+        self.jobs = Counter('uc_bot_jobs_total', 'Finished jobs of objects', ['object', 'status'])
+        self.render_seconds = Histogram('uc_bot_render_seconds', 'Time of rendering screenshot of object',
+                                        [0.5, 1, 2.5, 5, 10, 20, 30, 60, 120], ['object'])
+        self.upload_bytes = Histogram('uc_bot_upload_bytes', 'Size of images uploaded by object',
+                                      [2**i * 1024 for i in range(4, 15, 2)], ['object'])
+        self.messages = Counter('uc_bot_messages_total', 'Messages sent to chats', ['object', 'result'])
+        self.gauges = []
+
+
+    def add_gauge(self, name, help, fn, labels=()):
+        self.gauges.append(Gauge(name, help, fn, labels))
+
+
+    def on_job_event(self, event):
+        label = event['object']
+        if event['phase'] == 'rendered':
+            self.render_seconds.observe(label, value=event['seconds'])
+        elif event['phase'] == 'uploaded':
+            self.upload_bytes.observe(label, value=event['bytes'])
+        elif event['phase'] == 'sent':
+            self.messages.inc(label, 'success', value=event['successes'])
+            self.messages.inc(label, 'error', value=event['errors'])
+        elif event['phase'] in ('finished', 'failed'):
+            self.jobs.inc(label, event['phase'])
+
+
+    def render(self):
+        lines = []
+        for metric in [self.jobs, self.render_seconds, self.upload_bytes, self.messages] + self.gauges:
+            try:
+                lines += metric.render()
+            except Exception as e:
+                lines.append(f'# {metric.name} is not available: {e!r}')
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
+job_events.add_listener(METRICS.on_job_event)
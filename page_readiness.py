@@ -0,0 +1,52 @@
+import time
+
+from constants import *
+from util import print_if_debug
+
+
+# readyState, number of finished network requests and number of grafana panels which are still loading
+PAGE_STATE_SCRIPT = """
+return [
+    document.readyState,
+    window.performance.getEntriesByType('resource').length,
+    document.querySelectorAll(arguments[0]).length
+];
+"""
+
+GRAFANA_LOADING_SELECTORS = ', '.join([
+    '.panel-loading',
+    '.panel-loading-bar',
+    '[aria-label="Panel loading bar"]',
+    '[data-testid="panel-loading-bar"]',
+    '.preloader',
+])
+
+
+def wait_until_ready(driver, timeout, idle_time=PAGE_NETWORK_IDLE_TIME, poll_interval=PAGE_READY_POLL_INTERVAL):
+    """
+    Waits until document is loaded, grafana panels are drawn and no network requests were finished for idle_time seconds.
+    timeout is only upper bound, returns False if page was not ready in time
+    """
+    deadline = time.monotonic() + timeout
+    last_requests = None
+    last_change = time.monotonic()
+
+    while True:
+        now = time.monotonic()
+        try:
+            ready_state, requests, loading = driver.execute_script(PAGE_STATE_SCRIPT, GRAFANA_LOADING_SELECTORS)
+        except Exception:
+            ready_state, requests, loading = None, None, None
+
+        if requests != last_requests:
+            last_requests = requests
+            last_change = now
+
+        if ready_state == 'complete' and not loading and now - last_change >= idle_time:
+            return True
+
+        if now >= deadline:
+            print_if_debug(f'Page is not ready after {timeout} seconds, capturing as is', 'full')
+            return False
+
+        time.sleep(min(poll_interval, max(0, deadline - now)))
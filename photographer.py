@@ -1,15 +1,16 @@
-import os
-import time
-
+from abc import ABC, abstractmethod
 from PIL import Image
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 from constants import *
-from datetime import datetime
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver import FirefoxOptions
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from util import print_if_debug
+from browser_pool import BROWSER_POOL
+from page_readiness import wait_until_ready
+from stitcher import Stitcher, stitch_vertically, budget_scale
+from api.prew_image import encode_image
+from grafana_auth import GRAFANA_AUTH
+from libs.net.session_pool import get_session
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 
 
 def fullpage_screenshot(driver, element=None):
@@ -47,24 +48,27 @@ def fullpage_screenshot(driver, element=None):
 
             i = i + viewport_height
 
+        # full page capture is decoded in memory as a whole, pages over STITCH_MEMORY_MB are captured by viewports
+        if element is None and hasattr(driver, 'get_full_page_screenshot_as_png'):
+            if budget_scale(total_width, total_height, STITCH_MEMORY_MB) < 1:
+                print(f"Page is over {STITCH_MEMORY_MB} MB, scrolling ...")
+            else:
+                try:
+                    return single_capture_screenshot(driver, rectangles)
+                except Exception as e:
+                    print(f"Full page capture is not supported ({e}), scrolling ...")
+
         previous = None
         part = 0
-        stitched_image = Image.new('RGB', (total_width, total_height))
+        # canvas is memory-mapped from temporary file, tiles are written into it row by row
+        stitcher = Stitcher(total_width, [total_height])
 
         for rectangle in rectangles:
             if not previous is None:
-                if element:
-                    driver.execute_script("arguments[0].scrollTo({0}, {1})".format(rectangle[0], rectangle[1]), element)
-                else:
-                    driver.execute_script("window.scrollTo({0}, {1})".format(rectangle[0], rectangle[1]))
-                print("Scrolled To ({0},{1})".format(rectangle[0], rectangle[1]))
-                time.sleep(3)
-
-            file_name = "part_{0}.png".format(part)
-            print("Capturing {0} ...".format(file_name))
+                scroll_to(driver, rectangle, element)
 
-            driver.get_screenshot_as_file(file_name)
-            screenshot = Image.open(file_name)
+            print("Capturing part {0} ...".format(part))
+            screenshot = Image.open(BytesIO(driver.get_screenshot_as_png()))
 
             if rectangle[1] + viewport_height > total_height:
                 offset = (rectangle[0], total_height - viewport_height)
@@ -72,69 +76,156 @@ def fullpage_screenshot(driver, element=None):
                 offset = (rectangle[0], rectangle[1])
 
             print("Adding to stitched image with offset ({0}, {1})".format(offset[0],offset[1]))
-            stitched_image.paste(screenshot, offset)
+            stitcher.paste(screenshot, offset[0], offset[1])
 
             del screenshot
-            os.remove(file_name)
             part = part + 1
             previous = rectangle
 
         print("Finishing full page screenshot workaround...")
-        return stitched_image, total_height, total_width
+        return stitcher.images()[0], total_height, total_width
+
+
+def scroll_to(driver, rectangle, element=None):
+    if element:
+        driver.execute_script("arguments[0].scrollTo({0}, {1})".format(rectangle[0], rectangle[1]), element)
+    else:
+        driver.execute_script("window.scrollTo({0}, {1})".format(rectangle[0], rectangle[1]))
+    print("Scrolled To ({0},{1})".format(rectangle[0], rectangle[1]))
+    wait_until_ready(driver, PAGE_SCROLL_READY_TIMEOUT)
+
+
+def single_capture_screenshot(driver, rectangles):
+    """ Captures whole page by one call (firefox), page is scrolled through before to load lazy panels """
+    if len(rectangles) > 1:
+        for rectangle in rectangles[1:]:
+            scroll_to(driver, rectangle)
+        scroll_to(driver, (0, 0))
+
+    print("Capturing full page ...")
+    screenshot = Image.open(BytesIO(driver.get_full_page_screenshot_as_png()))
+    # kept in its own mode, stitcher converts it by strips
+    screenshot.load()
+
+    print("Finishing full page screenshot...")
+    return screenshot, screenshot.height, screenshot.width
+
+
+class Renderer(ABC):
+    """ Renders list of url configs to list of (image, height, width) """
+
+    @abstractmethod
+    def render(self, urls, grafana=None, driver=None):
+        pass
+
+
+class SeleniumRenderer(Renderer):
+    def render(self, urls, grafana=None, driver=None):
+        if driver is not None:
+            return self.render_with_driver(driver, urls, grafana)
 
+        with BROWSER_POOL.driver() as driver:
+            return self.render_with_driver(driver, urls, grafana)
 
-def we_are_logginned_into_grafana():
-    try:
-        WebDriverWait(driver=driver, timeout=1).until(EC.presence_of_element_located((By.XPATH, GRAFANA_LOGIN_FIELD_XPATH)))
-        return False
-        #return True
-    except:
-        return True
 
+    def render_with_driver(self, driver, urls, grafana=None):
+        images = []
+        for url in urls:
+            if grafana:
+                GRAFANA_AUTH.open(driver, url['url'], grafana, url['timeout'])
+            else:
+                driver.get(url['url'])
+                wait_until_ready(driver, url['timeout'])
+            images.append(fullpage_screenshot(driver))
+
+        return images
+
+
+def grafana_render_url(url):
+    """ Converts dashboard url (/d/<uid>/<slug>?...) to grafana render api url (/render/d/<uid>/<slug>?...) """
+    parts = urlsplit(url['url'])
+    path = parts.path
+    if not path.startswith('/render/'):
+        if not (path.startswith('/d/') or path.startswith('/d-solo/')):
+            raise ValueError(f'{url["url"]} is not a grafana dashboard url')
+        path = '/render' + path
+
+    query = dict(parse_qsl(parts.query, keep_blank_values=True))
+    query.setdefault('width', str(url.get('width', GRAFANA_RENDER_WIDTH)))
+    query.setdefault('height', str(url.get('height', GRAFANA_RENDER_HEIGHT)))
+    query.setdefault('timeout', str(url['timeout']))
+
+    return urlunsplit((parts.scheme, parts.netloc, path, urlencode(query), ''))
+
+
+class GrafanaApiRenderer(Renderer):
+    """ Fetches png images from grafana /render endpoint over pooled keep-alive http sessions """
 
+    def render(self, urls, grafana=None, driver=None):
+        images = []
+        for url in urls:
+            auth = (grafana['LOGIN'], grafana['PASSWORD']) if grafana else None
+            response = get_session(url['url']).get(grafana_render_url(url), auth=auth, timeout=url['timeout'] + GRAFANA_RENDER_TIMEOUT_MARGIN)
+            if response.status_code != 200 or not response.headers.get('Content-Type', '').startswith('image/'):
+                raise RuntimeError(f'Grafana render of {url["url"]} failed with status code {response.status_code}')
 
-def login_to_grafana(driver, username, password):
-    WebDriverWait(driver=driver, timeout=10).until(EC.presence_of_element_located((By.XPATH, GRAFANA_LOGIN_FIELD_XPATH)))
-    driver.find_element_by_xpath(GRAFANA_LOGIN_FIELD_XPATH).send_keys(username)
-    driver.find_element_by_xpath(GRAFANA_PASSWORD_FIELD_XPATH).send_keys(password)
-    driver.find_element_by_xpath(GRAFANA_LOGIN_BUTTON_XPATH).click()
-    WebDriverWait(driver=driver, timeout=10).until(lambda x: x.execute_script("return document.readyState === 'complete'"))
-    time.sleep(5)
+            image = Image.open(BytesIO(response.content))
+            image.load()
+            images.append((image.convert('RGB'), image.height, image.width))
 
+        return images
 
-def make_screen(urls, screenshot_filename, grafana=None):
-    opts = FirefoxOptions()
-    opts.add_argument("--headless")
-    driver = webdriver.Firefox(options=opts)
 
-    driver.get(urls[0]['url'])
+RENDERERS = {'selenium':SeleniumRenderer(), 'grafana_api':GrafanaApiRenderer()}
 
-    if grafana:
-        login_to_grafana(driver=driver, username = grafana['LOGIN'], password = grafana['PASSWORD'])
-        attempts = 5
-        while not we_are_logginned_into_grafana():
-            if attempts <= 0:
-                raise TimeoutError(f'All {attempts} attempts of login to grafana were not successfull')
-            login_to_grafana(driver=driver, username = grafana['LOGIN'], password = grafana['PASSWORD'])
-            attempts -= 1
 
-    total_height = 0
-    images = []
+def render_urls(urls, grafana=None, driver=None, renderer=None, parallel=RENDER_PARALLEL_URLS):
+    """
+    Renders urls to list of (image, height, width) in the order of urls.
+    Urls are rendered in parallel, each of them in its own pooled browser; with given driver they are rendered one by one
+    """
+    names = []
     for url in urls:
-        driver.get(url['url'])
-        timer = datetime.now()
-        time.sleep(url['timeout'])
-        images.append(fullpage_screenshot(driver))
-        total_height += images[-1][1]
+        name = url.get('renderer') or renderer or DEFAULT_RENDERER
+        if name not in RENDERERS:
+            raise ValueError(f'Unknown renderer {name}, avaliable: {", ".join(RENDERERS)}')
+        names.append(name)
+
+    def render_one(name, url):
+        return RENDERERS[name].render([url], grafana=grafana, driver=driver)[0]
+
+    if driver is not None or parallel <= 1 or len(urls) <= 1:
+        return [render_one(name, url) for name, url in zip(names, urls)]
+
+    with ThreadPoolExecutor(max_workers=min(parallel, len(urls)), thread_name_prefix='render-url') as executor:
+        return list(executor.map(render_one, names, urls))
+
+
+def part_filename(filename, index):
+    """ Filename of index part of split screenshot: the first one keeps filename, others get _<n> suffix """
+    if index == 0:
+        return filename
+    name, dot, extension = filename.rpartition('.')
+    return f'{name}_{index + 1}{dot}{extension}' if dot else f'{filename}_{index + 1}'
+
+
+def make_screen(urls, screenshot_filename=None, grafana=None, driver=None, renderer=None, image_format=None, quality=None,
+                colors=None, parallel=RENDER_PARALLEL_URLS, max_height=MAX_IMAGE_HEIGHT):
+    """
+    Returns stitched screenshot of urls as list of PIL images, it is split into several images not taller than max_height.
+    Images are also saved if screenshot_filename is given (encoded in image_format with quality/colors, see encode_image)
+    """
+    images = render_urls(urls, grafana=grafana, driver=driver, renderer=renderer, parallel=parallel)
+    parts = stitch_vertically(images, max_height, STITCH_MEMORY_MB)
+    del images
 
-    stitched_image = Image.new('RGB', (images[-1][2], total_height))
-    i = 0
-    for image in images:
-        stitched_image.paste(image[0], (0, i))
-        i += image[1]
-    stitched_image.save(screenshot_filename)
+    if parts[0].info['scale'] < 1:
+        print_if_debug(f"Stitched image is over {STITCH_MEMORY_MB} MB, downscaled by {parts[0].info['scale']:.2f}")
 
-    driver.quit()
+    if screenshot_filename is not None:
+        for index, part in enumerate(parts):
+            with open(part_filename(screenshot_filename, index), 'wb') as file:
+                file.write(encode_image(part, image_format, quality, colors).getbuffer())
 
     print('success')
-    return True
\ No newline at end of file
+    return parts
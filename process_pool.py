@@ -0,0 +1,204 @@
+import os
+import queue
+import itertools
+import threading
+import traceback
+import collections
+import multiprocessing
+
+from constants import *
+from util import print_if_debug
+from browser_pool import process_rss_mb
+
+
+def worker_main(worker_id, tasks, results, max_rss_mb, max_jobs):
+    """
+    Runs jobs from its own tasks queue until max_jobs jobs are done or RSS grows over max_rss_mb,
+    result of the last job tells that the worker is going to exit
+    """
+    jobs = 0
+    reason = 'stopped'
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+
+            job_id, fn, args = task
+            try:
+                success, result = True, fn(*args)
+            except Exception:
+                success, result = False, traceback.format_exc()
+
+            jobs += 1
+            rss = process_rss_mb(os.getpid())
+            if jobs >= max_jobs:
+                reason = f'{jobs} jobs done'
+            elif rss is not None and rss > max_rss_mb:
+                reason = f'RSS is {int(rss)} MB'
+
+            results.put(('done', worker_id, job_id, success, result, reason != 'stopped'))
+            if reason != 'stopped':
+                break
+    finally:
+        from browser_pool import BROWSER_POOL
+        BROWSER_POOL.close()
+        results.put(('exit', worker_id, reason))
+
+
+class ProcessPool:
+    """
+    Pool of worker processes, every worker has its own tasks queue and jobs are sent to idle workers by the pool,
+    so the pool always knows which worker has the job. Results are returned over the shared results queue.
+    Workers are recycled after max_jobs jobs or when their RSS grows over max_rss_mb,
+    job of the worker which has died is failed and the worker is restarted.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_rss_mb=PROCESS_MAX_RSS_MB, max_jobs=PROCESS_MAX_JOBS):
+        self.workers = workers
+        self.max_rss_mb = max_rss_mb
+        self.max_jobs = max_jobs
+
+        # spawn: forking a process with running threads may leave locks acquired in the child
+        self.context = multiprocessing.get_context('spawn')
+        self.results = None
+
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+        self.processes = {}   # worker_id -> Process
+        self.tasks = {}       # worker_id -> its tasks queue
+        self.idle = []        # workers waiting for a job
+        self.pending = collections.deque()   # (job_id, fn, args) waiting for idle worker
+        self.in_flight = {}   # worker_id -> job_id
+        self.waiters = {}     # job_id -> [Event, result]
+        self.exited = set()   # workers which reported their exit
+        self.collector = None
+
+        self.recycled = 0
+        self.died = 0
+
+
+    def start(self):
+        with self.lock:
+            if self.collector is not None:
+                return
+
+            self.results = self.context.Queue()
+
+            for worker_id in range(self.workers):
+                self.start_worker(worker_id)
+
+            self.collector = threading.Thread(target=self.collect, name='process-pool-collector', daemon=True)
+            self.collector.start()
+
+
+    def start_worker(self, worker_id):
+        """ Called with lock held """
+        self.tasks[worker_id] = self.context.Queue()
+        process = self.context.Process(target=worker_main, name=f'render-worker-{worker_id}', daemon=True,
+                                       args=(worker_id, self.tasks[worker_id], self.results, self.max_rss_mb, self.max_jobs))
+        process.start()
+        self.processes[worker_id] = process
+        self.idle.append(worker_id)
+        self.dispatch()
+
+
+    def dispatch(self):
+        """ Sends pending jobs to idle workers, called with lock held """
+        while self.pending and self.idle:
+            worker_id = self.idle.pop()
+            task = self.pending.popleft()
+            # job is in flight before it is sent, so it is failed even if worker dies before taking it
+            self.in_flight[worker_id] = task[0]
+            self.tasks[worker_id].put(task)
+
+
+    def run(self, fn, args=()):
+        """ Runs fn(*args) in one of workers and returns its result, fn and args must be picklable """
+        if self.collector is None:
+            self.start()
+
+        job_id = next(self.counter)
+        waiter = [threading.Event(), None]
+        with self.lock:
+            self.waiters[job_id] = waiter
+            self.pending.append((job_id, fn, args))
+            self.dispatch()
+
+        waiter[0].wait()
+
+        success, result = waiter[1]
+        if not success:
+            raise RuntimeError(f'Job failed in worker process:\n{result}')
+        return result
+
+
+    def finish(self, job_id, success, result):
+        with self.lock:
+            waiter = self.waiters.pop(job_id, None)
+        if waiter is not None:
+            waiter[1] = (success, result)
+            waiter[0].set()
+
+
+    def collect(self):
+        while True:
+            try:
+                message = self.results.get(timeout=1)
+            except queue.Empty:
+                message = None
+
+            if message is not None:
+                if message[0] == 'done':
+                    worker_id, job_id, success, result, exiting = message[1:]
+                    with self.lock:
+                        self.in_flight.pop(worker_id, None)
+                        if not exiting:
+                            self.idle.append(worker_id)
+                            self.dispatch()
+                    self.finish(job_id, success, result)
+                elif message[0] == 'exit':
+                    with self.lock:
+                        self.exited.add(message[1])
+                    print_if_debug(f'Render worker {message[1]} exited: {message[2]}', 'full')
+
+            self.check_workers()
+
+
+    def check_workers(self):
+        with self.lock:
+            dead = [worker_id for worker_id, process in self.processes.items() if not process.is_alive()]
+
+        for worker_id in dead:
+            process = self.processes[worker_id]
+            process.join()
+
+            with self.lock:
+                # worker exited by itself, its last messages are still in results queue
+                if process.exitcode == 0 and worker_id not in self.exited:
+                    continue
+
+                self.exited.discard(worker_id)
+                if worker_id in self.idle:
+                    self.idle.remove(worker_id)
+                job_id = self.in_flight.pop(worker_id, None)
+                if process.exitcode == 0:
+                    self.recycled += 1
+                else:
+                    self.died += 1
+
+            if job_id is not None:
+                self.finish(job_id, False, f'Worker process died with exit code {process.exitcode}')
+
+            with self.lock:
+                self.start_worker(worker_id)
+
+
+    def stats(self):
+        with self.lock:
+            return {'workers':self.workers, 'busy':len(self.in_flight), 'waiting':len(self.pending),
+                    'recycled':self.recycled, 'died':self.died}
+
+
+PROCESS_POOL = ProcessPool()
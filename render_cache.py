@@ -0,0 +1,133 @@
+import time
+import hashlib
+import threading
+
+from constants import *
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+
+def normalize_url(url):
+    """ Same page written differently (host case, query parameters order) gives the same url """
+    parts = urlsplit(url.strip())
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', query, parts.fragment))
+
+
+def render_key(urls, grafana=None, renderer=None):
+    """ Key of rendered image: normalized urls with their renderer and viewport, and identity of grafana credentials """
+    pages = tuple((normalize_url(url['url']), url.get('renderer') or renderer or DEFAULT_RENDERER,
+                   int(url.get('width', GRAFANA_RENDER_WIDTH)), int(url.get('height', GRAFANA_RENDER_HEIGHT)))
+                  for url in urls)
+
+    identity = None
+    if grafana:
+        identity = (grafana['LOGIN'], hashlib.sha256(str(grafana['PASSWORD']).encode(ENCODING)).hexdigest())
+    return pages, identity
+
+
+class RenderEntry:
+    """ Rendered images and everything made from them: derivatives, fingerprints, uploaded attachments """
+
+    def __init__(self, images, expires, owner=None):
+        self.images = images
+        self.expires = expires
+        self.owners = {owner}  # objects which have got the entry
+        self.lock = threading.Lock()
+        self.memos = {}
+        self.attachments = {}  # (ip, port, encoding settings) -> [(attachment_id, file_size) of every image]
+
+
+    def memo(self, key, fn):
+        """ Returns fn() computed once per entry """
+        with self.lock:
+            if key not in self.memos:
+                self.memos[key] = fn()
+            return self.memos[key]
+
+
+    def attachment(self, key):
+        with self.lock:
+            return self.attachments.get(key)
+
+
+    def store_attachment(self, key, attachment):
+        with self.lock:
+            self.attachments[key] = attachment
+
+
+class RenderCache:
+    """
+    Rendered images shared by objects with the same urls for ttl seconds.
+    Every object gets an entry only once, its next fire renders again even within ttl (it would send the same image).
+    Concurrent renders of the same key are collapsed into one (single-flight),
+    attachments uploaded from a cached image are reused per UC server.
+    """
+
+    def __init__(self, ttl=RENDER_CACHE_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}    # key -> RenderEntry
+        self.in_flight = {}  # key -> [Event, RenderEntry, error]
+
+        self.hits = 0
+        self.misses = 0
+        self.joined = 0
+
+
+    def render(self, key, fn, owner=None):
+        """
+        Returns RenderEntry of key for owner (LABEL of object), images are rendered by fn()
+        if there are no fresh ones which owner has not got yet
+        """
+        if self.ttl <= 0:
+            return RenderEntry(fn(), time.monotonic(), owner)
+
+        with self.lock:
+            now = time.monotonic()
+            for expired in [k for k, entry in self.entries.items() if entry.expires <= now]:
+                del self.entries[expired]
+
+            entry = self.entries.get(key)
+            if entry is not None and (owner is None or owner not in entry.owners):
+                self.hits += 1
+                entry.owners.add(owner)
+                return entry
+
+            flight = self.in_flight.get(key)
+            leader = flight is None
+            if leader:
+                self.misses += 1
+                flight = self.in_flight[key] = [threading.Event(), None, None]
+            else:
+                self.joined += 1
+
+        if not leader:
+            flight[0].wait()
+            if flight[2] is not None:
+                raise RuntimeError(f'Shared render has failed: {flight[2]}')
+            with self.lock:
+                flight[1].owners.add(owner)
+            return flight[1]
+
+        try:
+            flight[1] = RenderEntry(fn(), time.monotonic() + self.ttl, owner)
+        except Exception as error:
+            flight[2] = error
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+                if flight[1] is not None:
+                    self.entries[key] = flight[1]
+            flight[0].set()
+
+        return flight[1]
+
+
+    def stats(self):
+        with self.lock:
+            return {'ttl':self.ttl, 'entries':len(self.entries), 'in_flight':len(self.in_flight), 'hits':self.hits,
+                    'misses':self.misses, 'joined':self.joined}
+
+
+RENDER_CACHE = RenderCache()
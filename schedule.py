@@ -0,0 +1,74 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from util import set_time_conditions
+
+
+DAY_SECONDS = 24 * 60 * 60
+
+
+def compile_schedule(time_string):
+    return Schedule(set_time_conditions(time_string), time_string)
+
+
+class Schedule:
+    """
+    Compiled time conditions (see util.set_time_conditions).
+    Fire times of a day are precomputed as sorted seconds from midnight, so next fire time is found by bisect.
+    Ranges with interval fire at begin, begin + interval, ... up to the end minute inclusive.
+    """
+
+    def __init__(self, conditions, time_string=None):
+        self.time_string = time_string
+        self.weekdays = conditions.get('weekdays')
+        self.every_days = conditions['every_days'].days if 'every_days' in conditions else None
+        self.first_day = conditions['day'].date() if 'day' in conditions else None
+
+        step = int(conditions['minutes'].total_seconds()) if 'minutes' in conditions else 60
+        # zero interval fired every minute before intervals in seconds
+        if step <= 0:
+            step = 60
+        offsets = set()
+        for tm in conditions['schedule']:
+            if tm['type'] == 'certain':
+                offsets.add(tm['hour'] * 3600 + tm['minute'] * 60)
+            elif tm['type'] == 'range':
+                begin = tm['begin']['hour'] * 3600 + tm['begin']['minute'] * 60
+                end = tm['end']['hour'] * 3600 + tm['end']['minute'] * 60
+                if tm['using_next_day']:
+                    end += DAY_SECONDS
+                # end minute is included as a whole
+                for offset in range(begin, end + 60, step):
+                    offsets.add(offset % DAY_SECONDS)
+
+        self.offsets = sorted(offsets)
+
+
+    def day_is_allowed(self, day):
+        if self.weekdays is not None:
+            return day.weekday() in self.weekdays
+        if self.every_days:
+            return day >= self.first_day and (day - self.first_day).days % self.every_days == 0
+        return True
+
+
+    def next_fire_after(self, now, inclusive=False):
+        """ Returns first fire time after now (or equal to now if inclusive), None if schedule never fires """
+        if not self.offsets:
+            return None
+
+        period = 7 * (self.every_days or 1) + 1
+        for days in range(period + 1):
+            day = now.date() + timedelta(days=days)
+            if not self.day_is_allowed(day):
+                continue
+
+            midnight = datetime.combine(day, datetime.min.time())
+            index = 0
+            if days == 0:
+                seconds = (now - midnight).total_seconds()
+                index = bisect_left(self.offsets, seconds) if inclusive else bisect_right(self.offsets, seconds)
+
+            if index < len(self.offsets):
+                return midnight + timedelta(seconds=self.offsets[index])
+
+        return None
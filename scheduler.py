@@ -0,0 +1,99 @@
+import heapq
+import itertools
+import threading
+
+from datetime import datetime
+
+
+class Scheduler:
+    """
+    Priority queue of objects keyed by their next fire time.
+    Objects are identified by LABEL, removing marks the heap entry as cancelled (lazy deletion),
+    so both add and remove take O(log n).
+    """
+
+    def __init__(self):
+        self.heap = []       # [fire_time, seq, obj, active]
+        self.entries = {}    # label -> heap entry
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+
+
+    def add(self, obj, now=None):
+        """ (Re)schedules object according to its obj['time'] schedule """
+        now = now or datetime.now()
+        fire_time = obj['time'].next_fire_after(now.replace(second=0, microsecond=0), inclusive=True)
+
+        with self.condition:
+            self.cancel(obj['LABEL'])
+            self.push(obj, fire_time)
+            self.condition.notify()
+
+
+    def remove(self, label):
+        with self.condition:
+            self.cancel(label)
+            self.condition.notify()
+
+
+    def cancel(self, label):
+        entry = self.entries.pop(label, None)
+        if entry is not None:
+            entry[3] = False
+
+
+    def push(self, obj, fire_time):
+        if fire_time is None:
+            return
+
+        entry = [fire_time, next(self.counter), obj, True]
+        self.entries[obj['LABEL']] = entry
+        heapq.heappush(self.heap, entry)
+
+
+    def next_fire(self, label):
+        with self.condition:
+            entry = self.entries.get(label)
+            return entry[0] if entry else None
+
+
+    def __len__(self):
+        with self.condition:
+            return len(self.entries)
+
+
+    def wait_due(self, max_sleep):
+        """
+        Waits until the earliest fire time (at most max_sleep seconds) and returns objects which are due,
+        each of them is rescheduled to its next fire time
+        """
+        with self.condition:
+            while True:
+                while self.heap and not self.heap[0][3]:
+                    heapq.heappop(self.heap)
+
+                now = datetime.now()
+                if self.heap and self.heap[0][0] <= now:
+                    break
+
+                timeout = max_sleep
+                if self.heap:
+                    timeout = min(timeout, (self.heap[0][0] - now).total_seconds())
+
+                # woken up by add/remove: recheck the top, timed out by max_sleep: let caller do its work
+                if not self.condition.wait(timeout=timeout) and timeout == max_sleep:
+                    return []
+
+            due = []
+            while self.heap and self.heap[0][0] <= now:
+                entry = heapq.heappop(self.heap)
+                if not entry[3]:
+                    continue
+
+                obj = entry[2]
+                del self.entries[obj['LABEL']]
+                due.append(obj)
+                # missed fire times are joined into one
+                self.push(obj, obj['time'].next_fire_after(now))
+
+            return due
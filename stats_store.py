@@ -0,0 +1,178 @@
+"""
+Stats of objects built from job events: every finished job becomes a JobRecord kept in a ring buffer
+of its object (the last STATS_LIMIT jobs), with running aggregates over all jobs since the start.
+"""
+import math
+import threading
+
+import job_events
+from constants import STATS_LIMIT
+
+
+class JobRecord:
+    """ One job of object: when it was started, durations of its phases, uploaded bytes and how it has ended """
+
+    __slots__ = ('time', 'status', 'seconds', 'render_seconds', 'upload_seconds', 'send_seconds', 'bytes', 'images',
+                 'scale', 'successes', 'errors', 'status_code', 'reason', 'error', 'crash_log')
+
+    def __init__(self, time):
+        self.time = time
+        self.status = None
+        self.seconds = None
+        self.render_seconds = None
+        self.upload_seconds = None
+        self.send_seconds = None
+        self.bytes = 0
+        self.images = 0
+        self.scale = 1       # < 1 if screenshot has been downscaled to fit into STITCH_MEMORY_MB
+        self.successes = 0   # messages delivered to chats
+        self.errors = 0      # messages not delivered
+        self.status_code = None
+        self.reason = None   # why nothing has been sent (skipped jobs)
+        self.error = None
+        self.crash_log = None
+
+
+    def apply(self, event):
+        phase = event['phase']
+        if phase == 'rendered':
+            self.render_seconds = event['seconds']
+            self.images = event.get('images', 0)
+            self.scale = event.get('scale', 1)
+        elif phase == 'uploaded':
+            self.upload_seconds = event['seconds']
+            self.bytes = event['bytes']
+        elif phase == 'sent':
+            self.send_seconds = (self.send_seconds or 0) + event['seconds']
+            self.successes += event['successes']
+            self.errors += event['errors']
+            self.error = event.get('error', self.error)   # the first chat message which has not been sent
+        elif phase == 'skipped':
+            self.reason = event.get('reason')
+        elif phase in ('finished', 'failed'):
+            self.seconds = event['seconds']
+            self.status_code = event.get('status_code')
+            self.error = event.get('error', self.error)
+            self.crash_log = event.get('crash_log')
+            if phase == 'failed':
+                self.status = 'failed'
+            elif self.errors:
+                self.status = 'partial'
+            elif self.reason is not None:
+                self.status = 'skipped'
+            else:
+                self.status = 'success'
+
+
+    @property
+    def is_error(self):
+        return self.status in ('failed', 'partial')
+
+
+    def as_dict(self):
+        return {name:getattr(self, name) for name in self.__slots__}
+
+
+class StatsRing:
+    """ The last capacity records of object: fixed list with index of the oldest one, append overwrites it """
+
+    def __init__(self, capacity=STATS_LIMIT):
+        self.records = [None] * capacity
+        self.head = 0   # index of the oldest record
+        self.size = 0
+
+        # running aggregates of all jobs, evicted ones included
+        self.count = 0
+        self.error_count = 0
+        self.total_seconds = 0.0
+
+
+    def append(self, record):
+        capacity = len(self.records)
+        if self.size < capacity:
+            self.records[(self.head + self.size) % capacity] = record
+            self.size += 1
+        else:
+            self.records[self.head] = record
+            self.head = (self.head + 1) % capacity
+
+        self.count += 1
+        self.error_count += record.is_error
+        self.total_seconds += record.seconds or 0
+
+
+    def __iter__(self):
+        """ Records from the oldest to the newest """
+        capacity = len(self.records)
+        for i in range(self.size):
+            yield self.records[(self.head + i) % capacity]
+
+
+    def aggregates(self):
+        """ Counts are of all jobs, latency percentiles are of the jobs in the buffer """
+        latencies = sorted(record.seconds for record in self if record.seconds is not None)
+        return {'count':self.count, 'errors':self.error_count, 'successes':self.count - self.error_count,
+                'error_rate':self.error_count / self.count if self.count else 0.0,
+                'mean_seconds':self.total_seconds / self.count if self.count else None,
+                'p50_seconds':percentile(latencies, 50), 'p95_seconds':percentile(latencies, 95)}
+
+
+def percentile(values, p):
+    """ Nearest-rank percentile of sorted values """
+    if not values:
+        return None
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class StatsStore:
+    """ Rings of objects keyed by LABEL, jobs in progress are collected from their events until they are done """
+
+    def __init__(self, capacity=STATS_LIMIT):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.rings = {}
+        self.running = {}   # job id -> JobRecord
+
+
+    def on_job_event(self, event):
+        with self.lock:
+            if event['phase'] == 'started':
+                self.running[event['job']] = JobRecord(event['time'])
+                return
+
+            record = self.running.get(event['job'])
+            if record is None:
+                # job without started event (crash of worker process)
+                record = self.running[event['job']] = JobRecord(event['time'])
+            record.apply(event)
+
+            if record.status is not None:
+                del self.running[event['job']]
+                if event['object'] not in self.rings:
+                    self.rings[event['object']] = StatsRing(self.capacity)
+                self.rings[event['object']].append(record)
+
+
+    def get(self, label, records=True):
+        """ {'aggregates', 'records'} of object, records are dicts from the oldest to the newest """
+        with self.lock:
+            ring = self.rings.get(label) or StatsRing(1)
+            stat = {'aggregates':ring.aggregates()}
+            if records:
+                stat['records'] = [record.as_dict() for record in ring]
+            return stat
+
+
+    def rename(self, old_label, new_label):
+        with self.lock:
+            if old_label in self.rings and old_label != new_label:
+                self.rings[new_label] = self.rings.pop(old_label)
+
+
+    def forget(self, label):
+        with self.lock:
+            self.rings.pop(label, None)
+
+
+STATS_STORE = StatsStore()
+job_events.add_listener(STATS_STORE.on_job_event)
@@ -0,0 +1,134 @@
+import mmap
+import tempfile
+
+from PIL import Image
+
+
+STRIP_HEIGHT = 256
+PIXEL_SIZE = 4 # RGBX, Pillow maps only 4 byte pixels without copying
+
+
+def split_heights(heights, max_height):
+    """
+    Heights of output images for parts of heights stitched vertically:
+    parts are kept whole while they fit into max_height, taller parts are cut
+    """
+    if not max_height:
+        return [sum(heights)]
+
+    canvases = []
+    current = 0
+    for height in heights:
+        if current and current + height > max_height:
+            canvases.append(current)
+            current = 0
+
+        current += height
+        while current > max_height:
+            canvases.append(max_height)
+            current -= max_height
+
+    if current:
+        canvases.append(current)
+    return canvases
+
+
+class Stitcher:
+    """
+    Stitches images into raw RGBX canvases memory-mapped from temporary files, so the OS can write their pages
+    back to disk and drop them instead of keeping the whole canvas resident (no swap is needed for it).
+    Images are written by strips of rows, so only one strip is copied at a time.
+    Canvases follow each other vertically, pasted image may span several of them.
+    """
+
+    def __init__(self, width, heights):
+        self.width = width
+        self.heights = list(heights)
+        self.buffers = [self.map_canvas(max(1, width * height * PIXEL_SIZE)) for height in self.heights]
+
+        self.starts = []
+        start = 0
+        for height in self.heights:
+            self.starts.append(start)
+            start += height
+
+
+    @staticmethod
+    def map_canvas(size):
+        # file is deleted right away, the map keeps it until the canvas is released
+        with tempfile.TemporaryFile() as file:
+            file.truncate(size)
+            return mmap.mmap(file.fileno(), size)
+
+
+    def paste(self, image, x, y):
+        """ Writes image with its top left corner at (x, y) of the whole stitched area """
+        width = min(image.width, self.width - x)
+        for strip_top in range(0, image.height, STRIP_HEIGHT):
+            strip_bottom = min(strip_top + STRIP_HEIGHT, image.height)
+            # only the strip is converted, not the whole image
+            strip = memoryview(image.crop((0, strip_top, width, strip_bottom)).convert('RGBX').tobytes())
+            self.write_rows(strip, width, x, y + strip_top, strip_bottom - strip_top)
+
+
+    def write_rows(self, data, width, x, y, rows):
+        for index, (start, height) in enumerate(zip(self.starts, self.heights)):
+            first, last = max(y, start), min(y + rows, start + height)
+            if first >= last:
+                continue
+
+            buffer = self.buffers[index]
+            row_size = width * PIXEL_SIZE
+            if x == 0 and width == self.width:
+                source = (first - y) * row_size
+                buffer[(first - start) * row_size:(last - start) * row_size] = data[source:source + (last - first) * row_size]
+                continue
+
+            for row in range(first, last):
+                source = (row - y) * row_size
+                target = ((row - start) * self.width + x) * PIXEL_SIZE
+                buffer[target:target + row_size] = data[source:source + row_size]
+
+
+    def images(self):
+        """
+        RGBX PIL images mapped onto canvases without copying (read-only, pasting into them makes a copy),
+        they are converted to RGB when encoded
+        """
+        return [Image.frombuffer('RGBX', (self.width, height), buffer, 'raw', 'RGBX', 0, 1)
+                for height, buffer in zip(self.heights, self.buffers) if height]
+
+
+def budget_scale(width, height, memory_mb=None):
+    """ Scale of width x height canvas fitting into memory_mb (1 if it fits or there is no budget) """
+    if not memory_mb:
+        return 1
+    size = width * height * PIXEL_SIZE
+    budget = memory_mb * 2**20
+    return 1 if size <= budget else (budget / size) ** 0.5
+
+
+def stitch_vertically(images, max_height=None, memory_mb=None):
+    """
+    Stitches list of (image, height, width) one under another, returns list of images not taller than max_height.
+    When canvases would take more than memory_mb, images are downscaled one by one as they are pasted,
+    so only canvases of the budget size are allocated; scale is saved in info['scale'] of returned images
+    """
+    scale = budget_scale(max(image[2] for image in images), sum(image[1] for image in images), memory_mb)
+    if scale < 1:
+        images = [(image, max(1, int(height * scale)), max(1, int(width * scale))) for image, height, width in images]
+
+    heights = [image[1] for image in images]
+    stitcher = Stitcher(max(image[2] for image in images), split_heights(heights, max_height))
+
+    y = 0
+    for image, height, width in images:
+        if (width, height) != image.size:
+            image = image.resize((width, height), Image.BILINEAR, reducing_gap=2.0)
+        stitcher.paste(image, 0, y)
+        y += height
+
+    parts = stitcher.images()
+    for part in parts:
+        part.info['scale'] = scale
+    return parts
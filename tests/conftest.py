@@ -0,0 +1,52 @@
+import os
+import sys
+import json
+import tempfile
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# constants loads config.json of current directory when there is no /etc/monitoring_bot,
+# tests get a minimal one without objects
+CONFIG_DIRECTORY = tempfile.mkdtemp(prefix='monitoring_bot_tests_')
+with open(os.path.join(CONFIG_DIRECTORY, 'config.json'), 'w') as f:
+    json.dump({'CLI':{'CLI_IP':'127.0.0.1', 'CLI_PORT':0}, 'CHATS_OBJECTS':[]}, f)
+os.chdir(CONFIG_DIRECTORY)
+
+# constants loads config on import, so modules of the bot are imported after it is written
+from schedule import compile_schedule
+from scheduler import Scheduler
+from cli_server import CLIThread
+
+
+def object_config(label):
+    return {'LABEL':label, 'URLS':[], 'CHATS':[], 'time':'10:00 * * *', 'GRAFANA':0, 'UC_PASSWORD':'secret'}
+
+
+def load_object(config):
+    """ Object as constants loads it from config """
+    obj = dict(config)
+    obj['time_config'] = obj['time']
+    obj['time'] = compile_schedule(obj['time'])
+    return obj
+
+
+@pytest.fixture
+def cli(tmp_path, monkeypatch):
+    """ cli server of objects a and b with config.json of them in current directory """
+    configs = [object_config('a'), object_config('b')]
+    (tmp_path / 'config.json').write_text(json.dumps({'CHATS_OBJECTS':configs}))
+    monkeypatch.chdir(tmp_path)
+
+    scheduler = Scheduler()
+    objects = [load_object(config) for config in configs]
+    for obj in objects:
+        scheduler.add(obj)
+
+    thread = CLIThread(objects, scheduler)
+    thread.start()
+    yield thread
+    thread.quit()
@@ -0,0 +1,95 @@
+import json
+import asyncio
+import urllib.request
+from urllib.error import HTTPError
+
+import pytest
+
+import admin_http
+from conftest import object_config
+
+
+@pytest.fixture
+def admin(cli, monkeypatch):
+    """ Base url of admin API served by cli server """
+    monkeypatch.setattr(admin_http, 'ADMIN_HTTP_PORT', 0)
+    thread = admin_http.AdminHTTPThread(cli)
+    thread.start()
+    yield f'http://127.0.0.1:{thread.server.server_address[1]}'
+    thread.quit()
+
+
+def request(url, method='GET', body=None, content_type='application/json'):
+    """ Returns (status code, content type, body) """
+    data = None
+    if body is not None:
+        data = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+    http_request = urllib.request.Request(url, data=data, method=method, headers={'Content-Type':content_type})
+    try:
+        with urllib.request.urlopen(http_request, timeout=10) as response:
+            return response.status, response.headers['Content-Type'], response.read().decode()
+    except HTTPError as e:
+        return e.code, e.headers['Content-Type'], e.read().decode()
+
+
+def test_configs_are_sent_without_passwords(admin):
+    status, content_type, body = request(f'{admin}/objects')
+    configs = json.loads(body)
+
+    assert (status, content_type) == (200, 'application/json; charset=utf-8')
+    assert [config['LABEL'] for config in configs] == ['a', 'b']
+    assert configs[0]['UC_PASSWORD'] == admin_http.REDACTED
+    assert json.loads(request(f'{admin}/objects/b')[2])['UC_PASSWORD'] == admin_http.REDACTED
+
+
+def test_object_is_added(admin, cli):
+    status, content_type, body = request(f'{admin}/objects', 'POST', object_config('c'))
+
+    assert status == 200
+    assert [obj['LABEL'] for obj in cli.objects] == ['a', 'b', 'c']
+
+
+@pytest.mark.parametrize('method, path, body, content_type, status', [
+    ('POST', '/objects', object_config('a'), 'application/json', 400),     # rejected by cli server
+    ('POST', '/objects', '{"LABEL":', 'application/json', 400),             # not json
+    ('POST', '/objects', 'LABEL=c', 'application/x-www-form-urlencoded', 415),
+    ('GET', '/objects/c', None, 'application/json', 404),
+    ('GET', '/crashes/no_such_crash', None, 'application/json', 404),
+    ('GET', '/no_such_path', None, 'application/json', 404),
+    ('PUT', '/objects', None, 'application/json', 501),
+])
+def test_failed_requests_get_error_status(admin, cli, method, path, body, content_type, status):
+    response = request(f'{admin}{path}', method, body, content_type)
+
+    assert response[0] == status
+    assert [obj['LABEL'] for obj in cli.objects] == ['a', 'b']
+
+
+def test_failed_request_gets_500(admin, cli, monkeypatch):
+    def fail(s):
+        raise RuntimeError('browser pool is broken')
+    monkeypatch.setattr(cli, 'show_executor_stats', fail)
+
+    status, content_type, body = request(f'{admin}/executor')
+
+    assert status == 500
+    assert 'browser pool is broken' in json.loads(body)['error']
+
+
+def test_request_timeout_gets_504(admin, cli, monkeypatch):
+    monkeypatch.setattr('cli_server.CLI_REQUEST_TIMEOUT', 0.2)
+    asyncio.run_coroutine_threadsafe(cli.config_lock.acquire(), cli.loop).result(10)
+    try:
+        status = request(f'{admin}/objects/a', 'DELETE')[0]
+    finally:
+        cli.loop.call_soon_threadsafe(cli.config_lock.release)
+
+    assert status == 504
+
+
+def test_metrics(admin):
+    status, content_type, body = request(f'{admin}/metrics')
+
+    assert status == 200 and content_type.startswith('text/plain; version=0.0.4')
+    assert '# TYPE uc_bot_jobs_total counter' in body
+    assert 'uc_bot_executor_queue_depth 0' in body
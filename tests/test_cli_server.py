@@ -0,0 +1,144 @@
+import json
+import struct
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from util import encode_frame
+from cli_server import CLIThread
+from conftest import object_config
+
+
+def execute(cli, data):
+    return asyncio.run_coroutine_threadsafe(cli.execute(data), cli.loop).result(10)
+
+
+def saved_labels():
+    with open('config.json') as f:
+        return [obj['LABEL'] for obj in json.load(f)['CHATS_OBJECTS']]
+
+
+def test_object_with_existing_label_is_not_added(cli):
+    replies = execute(cli, {'reason':'add_object', 'payload':object_config('a')})
+
+    assert replies.status == 'rejected'
+    assert [obj['LABEL'] for obj in cli.objects] == ['a', 'b']
+    assert saved_labels() == ['a', 'b']
+    assert len(cli.scheduler) == 2
+
+
+def test_added_label_is_normalized_before_it_is_checked(cli):
+    execute(cli, {'reason':'add_object', 'payload':object_config('c d')})
+    replies = execute(cli, {'reason':'add_object', 'payload':object_config('c_d')})
+
+    assert replies.status == 'rejected'
+    assert saved_labels() == ['a', 'b', 'c_d']
+    assert cli.indexes == {'a':0, 'b':1, 'c_d':2}
+
+
+def test_object_is_not_renamed_to_existing_label(cli):
+    replies = execute(cli, {'reason':'change_config', 'index':1, 'payload':{'LABEL':'a'}})
+
+    assert replies.status == 'rejected'
+    assert [obj['LABEL'] for obj in cli.objects] == ['a', 'b']
+    assert saved_labels() == ['a', 'b']
+    assert cli.scheduler.next_fire('a') is not None and cli.scheduler.next_fire('b') is not None
+
+
+def test_object_is_renamed(cli):
+    replies = execute(cli, {'reason':'change_config', 'index':1, 'payload':{'LABEL':'c'}})
+
+    assert replies.status == 'ok'
+    assert saved_labels() == ['a', 'c']
+    assert cli.indexes == {'a':0, 'c':1}
+    assert cli.scheduler.next_fire('b') is None and cli.scheduler.next_fire('c') is not None
+
+
+def test_object_is_found_by_label_after_indexes_have_changed(cli):
+    # cli has fetched configs before object a is deleted by someone else
+    execute(cli, {'reason':'delete_object', 'label':'a'})
+    replies = execute(cli, {'reason':'change_config', 'label':'b', 'payload':{'SKIP_UNCHANGED':'skip'}})
+
+    assert replies.status == 'ok'
+    assert cli.objects[0]['SKIP_UNCHANGED'] == 'skip'
+    assert execute(cli, {'reason':'delete_object', 'label':'b'}).status == 'ok'
+    assert saved_labels() == []
+
+
+@pytest.mark.parametrize('data', [{'label':'c'}, {'index':2}, {'index':-1}])
+def test_unknown_object_is_not_found(cli, data):
+    replies = execute(cli, dict(data, reason='delete_object'))
+
+    assert replies.status == 'not_found'
+    assert saved_labels() == ['a', 'b']
+
+
+@pytest.mark.parametrize('mode, status', [('true', 'rejected'), ('1', 'rejected'), ('yes', 'rejected'),
+                                          ('skip', 'ok'), ('text', 'ok'), ('false', 'ok'), ('', 'ok')])
+def test_skip_unchanged_is_checked_when_config_is_changed(cli, mode, status):
+    replies = execute(cli, {'reason':'change_config', 'index':0, 'payload':{'SKIP_UNCHANGED':mode}})
+
+    assert replies.status == status
+    assert ('SKIP_UNCHANGED' in cli.objects[0]) == (status == 'ok')
+
+
+def test_skip_unchanged_is_checked_when_object_is_added(cli):
+    replies = execute(cli, {'reason':'add_object', 'payload':dict(object_config('c'), SKIP_UNCHANGED=True)})
+
+    assert replies.status == 'rejected'
+    assert saved_labels() == ['a', 'b']
+
+
+def test_request_waiting_for_config_lock_times_out(cli, monkeypatch):
+    monkeypatch.setattr('cli_server.CLI_REQUEST_TIMEOUT', 0.2)
+    asyncio.run_coroutine_threadsafe(cli.config_lock.acquire(), cli.loop).result(10)
+    try:
+        replies = execute(cli, {'reason':'delete_object', 'index':0})
+    finally:
+        cli.loop.call_soon_threadsafe(cli.config_lock.release)
+
+    assert replies.status == 'timeout'
+    assert saved_labels() == ['a', 'b']
+    # request which has timed out waiting for the lock is not executed later
+    assert execute(cli, {'reason':'show_all_configs'})[0][0]['LABEL'] == 'a'
+
+
+def read_frames(data):
+    """ Frames read back by cli server from data sent by client """
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        frames = []
+        while True:
+            frame = await CLIThread.read_frame(reader)
+            if frame is None:
+                return frames
+            frames.append(frame)
+
+    return asyncio.run(read())
+
+
+def test_frame_round_trip():
+    messages = [{'reason':'show_stat', 'index':0}, 'Объект создан', [1, 2.5, None], {'urls':['x' * 100000]}]
+    data = b''.join(encode_frame('utf-8', message) for message in messages)
+
+    assert read_frames(data) == messages
+
+
+def test_frame_prefix_is_length_of_utf8_body():
+    frame = encode_frame('utf-8', 'ы')
+
+    assert struct.unpack('>I', frame[:4])[0] == len(frame) - 4 == len(json.dumps('ы', ensure_ascii=False).encode())
+
+
+def test_not_json_values_are_sent_as_strings():
+    moment = datetime(2024, 1, 2, 3, 4)
+
+    assert read_frames(encode_frame('utf-8', {'time':moment})) == [{'time':str(moment)}]
+
+
+def test_too_big_frame_is_rejected():
+    with pytest.raises(ValueError):
+        read_frames(struct.pack('>I', 2**31) + b'{}')
@@ -0,0 +1,119 @@
+import io
+import json
+import uuid
+import asyncio
+
+import pytest
+
+web = pytest.importorskip('aiohttp.web')
+pytest.importorskip('pydantic')
+
+from libs.net.http_client_async import AsyncUcClient
+from models.uc_api.uc_api_models import ChatEvent, GeneralError
+
+
+SESSION_ID = 'session-1'
+
+
+class FakeUc:
+    """ uc-access-layer-web answering with the next (status, body, headers) of replies, requests are collected """
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.requests = []
+
+
+    async def handle(self, request):
+        self.requests.append((request.path, dict(request.headers), await request.read()))
+        status, body, headers = self.replies.pop(0)
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body)
+        return web.Response(status=status, text=body, headers=headers, content_type='application/json')
+
+
+def run_with_uc(replies, fn):
+    """ Runs fn(client, ip, port) against local uc server, returns its result and the server """
+    uc = FakeUc(replies)
+
+    async def run():
+        app = web.Application()
+        app.router.add_post('/uc/v2/{endpoint:.*}', uc.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        client = AsyncUcClient()
+        try:
+            return await fn(client, '127.0.0.1', port)
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    return asyncio.run(run()), uc
+
+
+def chat_event(chat_id):
+    return ChatEvent(uuid=str(uuid.uuid4()), sender_id=5, chat_id=chat_id, chat_type='P2P', type='TEXT', plaintext='text')
+
+
+def test_login():
+    body = {'id':1, 'result_code':200, 'payload':{'user_id':5}}
+    result, uc = run_with_uc([(200, body, {'protei-uc-sessionid':SESSION_ID})],
+                             lambda client, ip, port: client.login(ip, port, 'bot', 'secret'))
+
+    assert result == (SESSION_ID, 5)
+    path, headers, request = uc.requests[0]
+    request = json.loads(request)
+    assert path == '/uc/v2/login'
+    assert (request['method'], request['payload']['login'], request['payload']['password']) == ('login', 'bot', 'secret')
+
+
+def test_failed_login_raises():
+    body = {'id':1, 'description':'wrong password', 'command':'login', 'reason':'wrong_credentials'}
+    with pytest.raises(RuntimeError, match='Cannot login'):
+        run_with_uc([(403, body, {})], lambda client, ip, port: client.login(ip, port, 'bot', 'wrong'))
+
+
+@pytest.mark.parametrize('data', [memoryview(b'png' * 1000), io.BytesIO(b'png' * 1000)])
+def test_upload_streams_buffer(data):
+    (response, size), uc = run_with_uc([(200, '', {'protei-uc-attachmentid':'42'})],
+                                       lambda client, ip, port: client.upload_file(ip, port, SESSION_ID, data, 'scrn.png', 'image/png',
+                                                                                   mediasize='m', attachment_id='41'))
+
+    assert size == 3000
+    assert response.status_code == 200 and response.headers['protei-uc-attachmentid'] == '42'
+    path, headers, body = uc.requests[0]
+    assert body == b'png' * 1000
+    assert (headers['protei-uc-sessionid'], headers['protei-uc-filename'], headers['Content-Type']) == (SESSION_ID, 'scrn.png', 'image/png')
+    assert (headers['protei-uc-mediasize'], headers['protei-uc-attachmentid']) == ('m', '41')
+
+
+@pytest.mark.parametrize('status, body', [(502, '<html>Bad Gateway</html>'), (503, {'error':'unavailable'}), (504, '')])
+def test_errors_of_proxy_are_returned_as_status(status, body):
+    response, uc = run_with_uc([(status, body, {})], lambda client, ip, port: client.send_request(ip, port, 'chat/event/send'))
+
+    assert response.status_code == status
+    assert response.data is None
+
+
+@pytest.mark.parametrize('status', [401, 500, 503])
+def test_uc_errors_are_parsed(status):
+    body = {'id':1, 'description':'failed', 'command':'chat/event/send', 'reason':'internal_error'}
+    response, uc = run_with_uc([(status, body, {})], lambda client, ip, port: client.send_request(ip, port, 'chat/event/send'))
+
+    assert response.status_code == status
+    assert isinstance(response.data, GeneralError) and response.data.description == 'failed'
+
+
+def test_send_events_reports_every_event():
+    events = [chat_event(chat_id) for chat_id in (1, 2, 3)]
+    sent = {'id':1, 'result_code':206, 'payload':{'failed_events':[{'uuid':events[1].uuid, 'reason':'chat_not_found'}]}}
+    replies = [(206, sent, {}), (503, '<html>Service Unavailable</html>', {})]
+
+    results, uc = run_with_uc(replies, lambda client, ip, port: client.send_events(ip, port, SESSION_ID, events, batch_size=2, parallel=1))
+
+    assert [(event.uuid, status_code, error) for event, status_code, error in results] == \
+           [(events[0].uuid, 206, None), (events[1].uuid, 206, 'chat_not_found'), (events[2].uuid, 503, 'status code 503')]
+    assert [len(json.loads(body)['payload']) for path, headers, body in uc.requests] == [2, 1]
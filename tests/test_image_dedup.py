@@ -0,0 +1,49 @@
+from PIL import Image, ImageDraw
+
+from image_dedup import fingerprint, is_unchanged, images_unchanged, DeliveredImages
+
+
+def dashboard(value=100, noise=None):
+    """ Panel with a bar of value height, noise is (x, y) of one changed pixel """
+    image = Image.new('RGB', (400, 300), (20, 20, 20))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((50, 300 - value, 150, 300), fill=(0, 200, 0))
+    draw.rectangle((250, 50, 350, 120), fill=(200, 200, 0))
+    if noise is not None:
+        image.putpixel(noise, (255, 255, 255))
+    return image
+
+
+def test_same_image_is_unchanged():
+    assert is_unchanged(fingerprint(dashboard()), fingerprint(dashboard()))
+
+
+def test_small_difference_is_unchanged():
+    assert is_unchanged(fingerprint(dashboard()), fingerprint(dashboard(noise=(10, 10))))
+
+
+def test_changed_panel_is_changed():
+    assert not is_unchanged(fingerprint(dashboard(100)), fingerprint(dashboard(250)))
+
+
+def test_missing_fingerprint_is_changed():
+    assert not is_unchanged(None, fingerprint(dashboard()))
+    assert not images_unchanged(None, [fingerprint(dashboard())])
+
+
+def test_split_images_are_compared_part_by_part():
+    parts = [fingerprint(dashboard(100)), fingerprint(dashboard(200))]
+
+    assert images_unchanged(parts, [fingerprint(dashboard(100)), fingerprint(dashboard(200))])
+    assert not images_unchanged(parts, parts[:1])
+    assert not images_unchanged(parts, [parts[0], fingerprint(dashboard(50))])
+
+
+def test_delivered_images():
+    delivered = DeliveredImages()
+    delivered.seed('a', 'fingerprint')
+    delivered.seed('a', None)
+
+    assert delivered.peek('a') == 'fingerprint'
+    delivered.forget('a')
+    assert delivered.peek('a') is None
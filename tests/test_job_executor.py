@@ -0,0 +1,67 @@
+import threading
+
+from job_executor import JobExecutor
+
+
+TIMEOUT = 5
+
+
+def blocking_executor(dedup):
+    """ Executor with one worker, job 'a' blocks until released, arguments of finished runs are collected """
+    executor = JobExecutor(workers=1, dedup=dedup)
+    started, release, finished = threading.Event(), threading.Event(), threading.Semaphore(0)
+    runs = []
+
+    def job(value):
+        started.set()
+        release.wait(TIMEOUT)
+        runs.append(value)
+        finished.release()
+
+    return executor, job, started, release, finished, runs
+
+
+def test_running_job_is_skipped():
+    executor, job, started, release, finished, runs = blocking_executor('skip')
+    assert executor.submit('a', job, args=(1,))
+    assert started.wait(TIMEOUT)
+
+    assert not executor.submit('a', job, args=(2,))
+    assert executor.is_busy('a')
+
+    release.set()
+    assert finished.acquire(timeout=TIMEOUT)
+    assert runs == [1]
+    assert executor.stats()['skipped'] == 1
+
+
+def test_running_job_is_coalesced_into_one_rerun():
+    executor, job, started, release, finished, runs = blocking_executor('coalesce')
+    executor.submit('a', job, args=(1,))
+    assert started.wait(TIMEOUT)
+
+    executor.submit('a', job, args=(2,))
+    executor.submit('a', job, args=(3,))
+    release.set()
+
+    assert finished.acquire(timeout=TIMEOUT)
+    assert finished.acquire(timeout=TIMEOUT)
+    assert runs == [1, 3]
+    assert not finished.acquire(timeout=0.1)
+    assert executor.stats()['coalesced'] == 2
+
+
+def test_queued_job_gets_the_newest_arguments_and_priority_order():
+    executor, job, started, release, finished, runs = blocking_executor('skip')
+    executor.submit('blocker', job, args=('blocker',))
+    assert started.wait(TIMEOUT)
+
+    executor.submit('low', job, args=('low',), priority=0)
+    executor.submit('high', job, args=('high 1',), priority=5)
+    executor.submit('high', job, args=('high 2',), priority=5)
+    release.set()
+
+    for _ in range(3):
+        assert finished.acquire(timeout=TIMEOUT)
+    assert runs == ['blocker', 'high 2', 'low']
+    assert executor.stats()['completed'] == 3
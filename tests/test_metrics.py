@@ -0,0 +1,72 @@
+import math
+
+from metrics import Counter, Histogram, Gauge, Metrics, format_labels, format_value
+
+
+def test_labels_are_escaped():
+    assert format_labels((), ()) == ''
+    assert format_labels(('object', 'status'), ('a "b"\\c\nd', 'failed')) == '{object="a \\"b\\"\\\\c\\nd",status="failed"}'
+
+
+def test_values():
+    assert format_value(math.inf) == '+Inf'
+    assert format_value(0.5) == '0.5'
+    assert format_value(3) == '3'
+
+
+def test_counter():
+    counter = Counter('jobs_total', 'Jobs', ['object'])
+    counter.inc('b')
+    counter.inc('a', value=2)
+    counter.inc('b')
+
+    assert counter.render() == ['# HELP jobs_total Jobs', '# TYPE jobs_total counter',
+                                'jobs_total{object="a"} 2', 'jobs_total{object="b"} 2']
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('seconds', 'Time', [1, 5], ['object'])
+    for value in (0.5, 3, 10):
+        histogram.observe('a', value=value)
+
+    assert histogram.render() == ['# HELP seconds Time', '# TYPE seconds histogram',
+                                  'seconds_bucket{object="a",le="1"} 1', 'seconds_bucket{object="a",le="5"} 2',
+                                  'seconds_bucket{object="a",le="+Inf"} 3', 'seconds_sum{object="a"} 13.5',
+                                  'seconds_count{object="a"} 3']
+
+
+def test_gauge():
+    assert Gauge('queue', 'Queue', lambda: 4).render()[2:] == ['queue 4']
+    assert Gauge('pool', 'Pool', lambda: {('idle',):1, ('busy',):2}, ['state']).render()[2:] == \
+           ['pool{state="busy"} 2', 'pool{state="idle"} 1']
+
+
+def event(phase, **fields):
+    return dict({'time':1.0, 'job':'1', 'object':'a', 'index':0, 'phase':phase}, **fields)
+
+
+def test_metrics_of_job_events():
+    metrics = Metrics()
+    for e in [event('started'), event('rendered', seconds=2.0, images=1), event('uploaded', seconds=0.1, bytes=50000, images=1),
+              event('sent', seconds=0.1, kind='Image', successes=3, errors=1), event('finished', seconds=2.5),
+              event('failed', seconds=0.1, error='boom')]:
+        metrics.on_job_event(e)
+    lines = metrics.render().splitlines()
+
+    assert 'uc_bot_jobs_total{object="a",status="finished"} 1' in lines
+    assert 'uc_bot_jobs_total{object="a",status="failed"} 1' in lines
+    assert 'uc_bot_render_seconds_bucket{object="a",le="2.5"} 1' in lines
+    assert 'uc_bot_render_seconds_bucket{object="a",le="1"} 0' in lines
+    assert 'uc_bot_upload_bytes_sum{object="a"} 50000' in lines
+    assert 'uc_bot_messages_total{object="a",result="error"} 1' in lines
+    assert 'uc_bot_messages_total{object="a",result="success"} 3' in lines
+
+
+def test_failing_gauge_does_not_break_metrics():
+    metrics = Metrics()
+    metrics.add_gauge('broken', 'Broken', lambda: 1 / 0)
+    metrics.add_gauge('working', 'Working', lambda: 1)
+    lines = metrics.render().splitlines()
+
+    assert "# broken is not available: ZeroDivisionError('division by zero')" in lines
+    assert 'working 1' in lines
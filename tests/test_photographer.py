@@ -0,0 +1,70 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import photographer
+
+
+def png(width, height, color):
+    buffer = BytesIO()
+    Image.new('RGBA', (width, height), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class FakeFirefox:
+    """ Page of width x height, every viewport is filled with its own color, full page capture is white """
+
+    def __init__(self, width, height, viewport_height):
+        self.width, self.height, self.viewport_height = width, height, viewport_height
+        self.y = 0
+        self.full_page_captures = 0
+
+
+    def execute_script(self, script, *args):
+        if 'offsetWidth' in script or 'clientWidth' in script:
+            return self.width
+        if 'scrollHeight' in script:
+            return self.height
+        if 'innerHeight' in script:
+            return self.viewport_height
+        if 'scrollTo' in script:
+            # browser does not scroll past the end of the page
+            self.y = min(int(script.split(', ')[1].rstrip(')')), self.height - self.viewport_height)
+            return None
+
+
+    def get_screenshot_as_png(self):
+        return png(self.width, self.viewport_height, (self.y % 256, 0, 0, 255))
+
+
+    def get_full_page_screenshot_as_png(self):
+        self.full_page_captures += 1
+        return png(self.width, self.height, (255, 255, 255, 255))
+
+
+@pytest.fixture(autouse=True)
+def ready_page(monkeypatch):
+    monkeypatch.setattr(photographer, 'wait_until_ready', lambda driver, timeout: True)
+
+
+def test_page_within_budget_is_captured_at_once():
+    driver = FakeFirefox(100, 250, 100)
+    image, height, width = photographer.fullpage_screenshot(driver)
+
+    assert driver.full_page_captures == 1
+    assert (image.size, height, width) == ((100, 250), 250, 100)
+    # decoded image is not copied into another mode
+    assert image.mode == 'RGBA'
+
+
+def test_page_over_budget_is_captured_by_viewports(monkeypatch):
+    monkeypatch.setattr(photographer, 'STITCH_MEMORY_MB', 100 * 250 * 4 / 2**20 / 2)
+    driver = FakeFirefox(100, 250, 100)
+    image, height, width = photographer.fullpage_screenshot(driver)
+    image = image.convert('RGB')
+
+    assert driver.full_page_captures == 0
+    assert (image.size, height, width) == ((100, 250), 250, 100)
+    # the last viewport is aligned to the bottom of the page
+    assert [image.getpixel((0, y))[0] for y in (0, 99, 100, 149, 150, 249)] == [0, 0, 100, 100, 150, 150]
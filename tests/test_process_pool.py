@@ -0,0 +1,67 @@
+import os
+import threading
+
+import pytest
+
+from process_pool import ProcessPool
+
+
+def square(value):
+    return value * value
+
+
+def fail():
+    raise ValueError('broken job')
+
+
+def die():
+    # worker is killed in the middle of the job, no 'done' message is sent
+    os._exit(3)
+
+
+@pytest.fixture
+def pool():
+    return ProcessPool(workers=1, max_rss_mb=10**6, max_jobs=100)
+
+
+def test_job_result_is_returned(pool):
+    assert pool.run(square, args=(7,)) == 49
+
+
+def test_failed_job_raises_with_traceback(pool):
+    with pytest.raises(RuntimeError, match='broken job'):
+        pool.run(fail)
+
+    assert pool.run(square, args=(3,)) == 9
+
+
+def test_job_of_dead_worker_fails_and_worker_is_restarted(pool):
+    with pytest.raises(RuntimeError, match='died with exit code 3'):
+        pool.run(die)
+
+    assert pool.run(square, args=(2,)) == 4
+    assert pool.stats()['died'] == 1
+
+
+def test_jobs_waiting_for_dead_worker_are_run_by_restarted_one(pool):
+    results = []
+    dying = threading.Thread(target=lambda: pytest.raises(RuntimeError, pool.run, die))
+    waiting = threading.Thread(target=lambda: results.append(pool.run(square, args=(4,))))
+
+    pool.start()
+    # the only worker is busy dying, the second job waits for it in pending
+    dying.start()
+    waiting.start()
+    dying.join(60)
+    waiting.join(60)
+
+    assert results == [16]
+
+
+def test_worker_is_recycled_after_max_jobs():
+    pool = ProcessPool(workers=1, max_rss_mb=10**6, max_jobs=1)
+
+    assert [pool.run(square, args=(value,)) for value in range(3)] == [0, 1, 4]
+    stats = pool.stats()
+    assert stats['recycled'] >= 1
+    assert stats['died'] == 0
@@ -0,0 +1,125 @@
+import time
+import threading
+
+from render_cache import RenderCache, render_key, normalize_url
+
+
+TIMEOUT = 5
+
+
+class Renders:
+    """ fn of RenderCache.render counting its calls """
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return [f'image {self.calls}']
+
+
+def test_render_is_shared_between_objects():
+    cache, renders = RenderCache(ttl=60), Renders()
+    a = cache.render('key', renders, owner='a')
+    b = cache.render('key', renders, owner='b')
+
+    assert a is b and renders.calls == 1
+    assert cache.stats()['hits'] == 1
+
+
+def test_object_does_not_get_its_own_render_again():
+    cache, renders = RenderCache(ttl=60), Renders()
+    first = cache.render('key', renders, owner='a')
+    second = cache.render('key', renders, owner='a')
+
+    assert (first.images, second.images) == (['image 1'], ['image 2'])
+    # the new render is shared with others, but not with the one who has made it
+    assert cache.render('key', renders, owner='b') is second
+    assert cache.render('key', renders, owner='b').images == ['image 3']
+
+
+def test_expired_render_is_not_shared():
+    cache, renders = RenderCache(ttl=0.05), Renders()
+    cache.render('key', renders, owner='a')
+    time.sleep(0.1)
+
+    assert cache.render('key', renders, owner='b').images == ['image 2']
+    assert cache.stats()['entries'] == 1
+
+
+def test_disabled_cache_renders_every_time():
+    cache, renders = RenderCache(ttl=0), Renders()
+    cache.render('key', renders, owner='a')
+    cache.render('key', renders, owner='b')
+
+    assert renders.calls == 2 and cache.stats()['entries'] == 0
+
+
+def blocked_render(release, result):
+    def render():
+        release.wait(TIMEOUT)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return render
+
+
+def render_in_threads(cache, render, owners):
+    entries, errors = {}, {}
+
+    def run(owner):
+        try:
+            entries[owner] = cache.render('key', render, owner=owner)
+        except Exception as e:
+            errors[owner] = e
+
+    threads = [threading.Thread(target=run, args=(owner,)) for owner in owners]
+    for thread in threads:
+        thread.start()
+        # the first thread is the leader
+        deadline = time.monotonic() + TIMEOUT
+        while not cache.in_flight and time.monotonic() < deadline:
+            time.sleep(0.001)
+    return threads, entries, errors
+
+
+def test_concurrent_renders_are_collapsed():
+    cache, release = RenderCache(ttl=60), threading.Event()
+    threads, entries, errors = render_in_threads(cache, blocked_render(release, ['image']), ['a', 'b', 'c'])
+    while cache.stats()['joined'] < 2:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(TIMEOUT)
+
+    assert not errors
+    assert entries['a'] is entries['b'] is entries['c']
+    assert cache.stats()['misses'] == 1
+    # objects which have joined the render do not get it again
+    assert cache.render('key', Renders(), owner='b').images == ['image 1']
+
+
+def test_failed_render_fails_joined_ones_and_is_not_cached():
+    cache, release = RenderCache(ttl=60), threading.Event()
+    threads, entries, errors = render_in_threads(cache, blocked_render(release, ValueError('no page')), ['a', 'b'])
+    while cache.stats()['joined'] < 1:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(TIMEOUT)
+
+    assert isinstance(errors['a'], ValueError)
+    assert isinstance(errors['b'], RuntimeError) and 'no page' in str(errors['b'])
+    assert cache.stats()['entries'] == 0 and cache.stats()['in_flight'] == 0
+
+
+def test_same_page_written_differently_has_the_same_key():
+    assert normalize_url('HTTP://Grafana:3000/d/x?b=2&a=1') == normalize_url('http://grafana:3000/d/x?a=1&b=2')
+
+    urls = [{'url':'http://grafana/d/x?b=2&a=1', 'timeout':5}]
+    same = [{'url':'http://GRAFANA/d/x?a=1&b=2', 'timeout':30}]
+    grafana = {'LOGIN':'admin', 'PASSWORD':'secret'}
+
+    assert render_key(urls, grafana) == render_key(same, grafana)
+    assert render_key(urls, grafana) != render_key(urls, dict(grafana, PASSWORD='other'))
+    assert render_key(urls, grafana) != render_key(urls, grafana, renderer='grafana_api')
@@ -0,0 +1,89 @@
+from datetime import datetime, date, time, timedelta
+
+from util import set_time_conditions
+from schedule import Schedule, compile_schedule
+
+
+TODAY = date.today()
+
+
+def at(hour, minute, second=0, days=0):
+    return datetime.combine(TODAY + timedelta(days=days), time(hour, minute, second))
+
+
+def schedule_from(time_string, first_day=TODAY):
+    """ Schedule counting every N days from first_day """
+    conditions = set_time_conditions(time_string)
+    if 'day' in conditions:
+        conditions['day'] = datetime.combine(first_day, time())
+    return Schedule(conditions, time_string)
+
+
+def test_certain_times():
+    schedule = compile_schedule('10:00,15:30 * * *')
+
+    assert schedule.next_fire_after(at(9, 59)) == at(10, 0)
+    assert schedule.next_fire_after(at(10, 0)) == at(15, 30)
+    assert schedule.next_fire_after(at(10, 0), inclusive=True) == at(10, 0)
+    assert schedule.next_fire_after(at(10, 0, 1), inclusive=True) == at(15, 30)
+    assert schedule.next_fire_after(at(16, 0)) == at(10, 0, days=1)
+
+
+def test_range_includes_both_ends():
+    schedule = compile_schedule('19:20-20:00 20 * *')
+
+    assert schedule.offsets == [19 * 3600 + 20 * 60, 19 * 3600 + 40 * 60, 20 * 3600]
+    assert schedule.next_fire_after(at(19, 40)) == at(20, 0)
+    assert schedule.next_fire_after(at(20, 0)) == at(19, 20, days=1)
+
+
+def test_range_wrapping_midnight():
+    schedule = compile_schedule('22:00-4:00 30 * *')
+
+    assert schedule.next_fire_after(at(21, 0)) == at(22, 0)
+    assert schedule.next_fire_after(at(23, 45)) == at(0, 0, days=1)
+    assert schedule.next_fire_after(at(3, 30)) == at(4, 0)
+    assert schedule.next_fire_after(at(4, 0), inclusive=True) == at(4, 0)
+    assert schedule.next_fire_after(at(4, 0)) == at(22, 0)
+
+
+def test_interval_in_seconds():
+    schedule = compile_schedule('09:00-09:01 30s * *')
+
+    # end minute is included as a whole
+    assert schedule.offsets == [32400, 32430, 32460, 32490]
+    assert schedule.next_fire_after(at(9, 0, 10)) == at(9, 0, 30)
+    assert schedule.next_fire_after(at(9, 1, 30)) == at(9, 0, days=1)
+
+
+def test_zero_interval_is_one_minute():
+    assert len(compile_schedule('09:00-10:00 0 * *').offsets) == 61
+    assert len(compile_schedule('09:00-10:00 0s * *').offsets) == 61
+
+
+def test_weekdays():
+    monday = TODAY - timedelta(days=TODAY.weekday())
+    schedule = compile_schedule('10:00 * * 1,3')
+    start = datetime.combine(monday, time(10, 0))
+
+    assert schedule.next_fire_after(start) == start + timedelta(days=2)
+    assert schedule.next_fire_after(start + timedelta(days=2)) == start + timedelta(days=7)
+    assert schedule.next_fire_after(start - timedelta(days=1)) == start
+
+
+def test_every_n_days():
+    schedule = schedule_from('20:00 * 3 *')
+
+    assert schedule.next_fire_after(at(19, 0)) == at(20, 0)
+    assert schedule.next_fire_after(at(20, 0)) == at(20, 0, days=3)
+    assert schedule.next_fire_after(at(12, 0, days=4)) == at(20, 0, days=6)
+
+
+def test_every_n_days_does_not_fire_before_first_day():
+    schedule = schedule_from('20:00 * 2 *', first_day=TODAY + timedelta(days=5))
+
+    assert schedule.next_fire_after(at(0, 0)) == at(20, 0, days=5)
+
+
+def test_empty_schedule_never_fires():
+    assert Schedule({'schedule':[]}).next_fire_after(at(0, 0)) is None
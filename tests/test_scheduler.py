@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+from scheduler import Scheduler
+
+
+class FiresOnce:
+    """ Schedule firing at fire_time, then only in a day """
+
+    def __init__(self, fire_time):
+        self.fire_time = fire_time
+        self.calls = 0
+
+
+    def next_fire_after(self, now, inclusive=False):
+        self.calls += 1
+        if self.calls == 1:
+            return self.fire_time
+        return now + timedelta(days=1)
+
+
+def make_object(label, fire_time):
+    return {'LABEL':label, 'time':FiresOnce(fire_time)}
+
+
+def test_due_object_is_rescheduled():
+    scheduler = Scheduler()
+    obj = make_object('a', datetime.now() - timedelta(seconds=1))
+    scheduler.add(obj)
+
+    assert scheduler.wait_due(1) == [obj]
+    assert scheduler.next_fire('a') > datetime.now() + timedelta(hours=23)
+    assert len(scheduler) == 1
+
+
+def test_removed_object_is_not_due():
+    scheduler = Scheduler()
+    past = datetime.now() - timedelta(seconds=1)
+    a, b = make_object('a', past), make_object('b', past)
+    scheduler.add(a)
+    scheduler.add(b)
+    scheduler.remove('a')
+
+    assert scheduler.wait_due(1) == [b]
+    assert scheduler.next_fire('a') is None
+    # cancelled entry is dropped lazily, when it gets to the top of the heap
+    assert len(scheduler.heap) == 1
+
+
+def test_readded_object_is_due_once():
+    scheduler = Scheduler()
+    past = datetime.now() - timedelta(seconds=1)
+    obj = make_object('a', past)
+    scheduler.add(obj)
+    obj['time'] = FiresOnce(past)
+    scheduler.add(obj)
+
+    assert scheduler.wait_due(1) == [obj]
+    assert scheduler.wait_due(0.05) == []
+
+
+def test_nothing_due_until_max_sleep():
+    scheduler = Scheduler()
+    scheduler.add(make_object('a', datetime.now() + timedelta(hours=1)))
+
+    assert scheduler.wait_due(0.05) == []
+
+
+def test_object_which_never_fires_is_not_scheduled():
+    scheduler = Scheduler()
+    scheduler.add(make_object('a', None))
+
+    assert len(scheduler) == 0
+    assert scheduler.wait_due(0.05) == []
@@ -0,0 +1,91 @@
+from stats_store import JobRecord, StatsRing, StatsStore, percentile
+
+
+def record(seconds, status='success'):
+    job = JobRecord(0)
+    job.seconds = seconds
+    job.status = status
+    return job
+
+
+def test_ring_keeps_the_last_records():
+    ring = StatsRing(3)
+    for seconds in range(5):
+        ring.append(record(seconds))
+
+    assert [job.seconds for job in ring] == [2, 3, 4]
+    assert ring.size == 3
+    assert ring.aggregates()['count'] == 5
+
+
+def test_aggregates_count_evicted_errors():
+    ring = StatsRing(2)
+    ring.append(record(1, 'failed'))
+    ring.append(record(2, 'partial'))
+    ring.append(record(3))
+    ring.append(record(4, 'skipped'))
+    aggregates = ring.aggregates()
+
+    assert aggregates['errors'] == 2
+    assert aggregates['successes'] == 2
+    assert aggregates['error_rate'] == 0.5
+    assert aggregates['mean_seconds'] == 2.5
+    # percentiles are of the records in the ring
+    assert aggregates['p50_seconds'] == 3
+    assert aggregates['p95_seconds'] == 4
+
+
+def test_empty_ring():
+    aggregates = StatsRing(2).aggregates()
+
+    assert aggregates['count'] == 0
+    assert aggregates['error_rate'] == 0.0
+    assert aggregates['p50_seconds'] is None
+
+
+def test_percentile():
+    values = list(range(1, 101))
+
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile([7], 95) == 7
+    assert percentile([], 50) is None
+
+
+def event(job, phase, **fields):
+    return dict({'time':1.0, 'job':job, 'object':'a', 'index':0, 'phase':phase}, **fields)
+
+
+def test_store_builds_records_from_job_events():
+    store = StatsStore(capacity=10)
+    store.on_job_event(event('1', 'started'))
+    store.on_job_event(event('1', 'rendered', seconds=2.0, images=1, scale=0.5))
+    store.on_job_event(event('1', 'uploaded', seconds=0.5, bytes=1000, images=1))
+    store.on_job_event(event('1', 'sent', seconds=0.25, kind='Image', successes=2, errors=1, error='chat 3 has failed'))
+    store.on_job_event(event('1', 'finished', seconds=3.0, status_code=500))
+    store.on_job_event(event('2', 'started'))
+    store.on_job_event(event('2', 'skipped', reason='image has not changed'))
+    store.on_job_event(event('2', 'finished', seconds=1.0, status_code=200))
+    store.on_job_event(event('3', 'failed', seconds=0.1, error='boom', crash_log='log'))
+
+    stat = store.get('a')
+    first, second, third = stat['records']
+    assert (first['status'], first['render_seconds'], first['bytes'], first['scale']) == ('partial', 2.0, 1000, 0.5)
+    assert (first['successes'], first['errors'], first['error']) == (2, 1, 'chat 3 has failed')
+    assert (second['status'], second['reason']) == ('skipped', 'image has not changed')
+    assert (third['status'], third['crash_log']) == ('failed', 'log')
+    assert stat['aggregates']['errors'] == 2
+    assert store.running == {}
+
+
+def test_store_rename_and_forget():
+    store = StatsStore(capacity=10)
+    store.on_job_event(event('1', 'started'))
+    store.on_job_event(event('1', 'finished', seconds=1.0))
+    store.rename('a', 'b')
+
+    assert store.get('a')['aggregates']['count'] == 0
+    assert store.get('b', records=False) == {'aggregates':store.get('b')['aggregates']}
+
+    store.forget('b')
+    assert store.get('b')['records'] == []
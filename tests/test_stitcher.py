@@ -0,0 +1,58 @@
+from PIL import Image
+
+from stitcher import split_heights, budget_scale, Stitcher, stitch_vertically
+
+
+RED, GREEN, BLUE = (255, 0, 0), (0, 255, 0), (0, 0, 255)
+
+
+def test_split_heights():
+    assert split_heights([100, 200], None) == [300]
+    assert split_heights([100, 200], 300) == [300]
+    # parts are kept whole while they fit
+    assert split_heights([200, 200, 50], 300) == [200, 250]
+    # taller parts are cut
+    assert split_heights([700], 300) == [300, 300, 100]
+    assert split_heights([100, 700], 300) == [100, 300, 300, 100]
+
+
+def test_budget_scale():
+    assert budget_scale(1000, 1000, None) == 1
+    assert budget_scale(1024, 256, 1) == 1
+    assert abs(budget_scale(1024, 1024, 1) - 0.5) < 1e-9
+
+
+def test_stitch_vertically_splits_and_pads():
+    images = [(Image.new('RGB', (4, 2), RED), 2, 4), (Image.new('RGB', (4, 3), GREEN), 3, 4),
+              (Image.new('RGB', (2, 4), BLUE), 4, 2)]
+    parts = stitch_vertically(images, max_height=5)
+
+    assert [part.size for part in parts] == [(4, 5), (4, 4)]
+    assert parts[0].convert('RGB').getpixel((3, 1)) == RED
+    assert parts[0].convert('RGB').getpixel((3, 2)) == GREEN
+    assert parts[1].convert('RGB').getpixel((1, 3)) == BLUE
+    # narrower image leaves the rest of the row empty
+    assert parts[1].convert('RGB').getpixel((3, 0)) == (0, 0, 0)
+    assert parts[0].info['scale'] == 1
+
+
+def test_paste_spanning_canvases_at_offset():
+    stitcher = Stitcher(6, [3, 3])
+    stitcher.paste(Image.new('RGB', (2, 4), GREEN), 3, 1)
+    top, bottom = [image.convert('RGB') for image in stitcher.images()]
+
+    assert top.getpixel((3, 0)) == (0, 0, 0)
+    assert top.getpixel((3, 1)) == GREEN
+    assert top.getpixel((4, 2)) == GREEN
+    assert top.getpixel((5, 2)) == (0, 0, 0)
+    assert bottom.getpixel((4, 1)) == GREEN
+    assert bottom.getpixel((4, 2)) == (0, 0, 0)
+
+
+def test_stitch_vertically_downscales_to_budget():
+    images = [(Image.new('RGB', (1024, 512), RED), 512, 1024)] * 2
+    parts = stitch_vertically(images, max_height=None, memory_mb=1)
+
+    assert [part.size for part in parts] == [(512, 512)]
+    assert abs(parts[0].info['scale'] - 0.5) < 1e-9
+    assert parts[0].convert('RGB').getpixel((511, 511)) == RED
@@ -1,6 +1,8 @@
 import os
 import sys
+import json
 import time
+import struct
 
 from PIL import Image
 from datetime import datetime, timedelta
@@ -35,69 +37,6 @@ def print_if_debug(string, mode='short', end='\n'):
         print(string, end=end)
 
 
-def datetime_in_timerange(time, timerange):
-    hour = time.hour
-    minute = time.minute
-    if timerange['using_next_day']:
-        if hour > timerange['begin']['hour']:
-            return True
-        elif hour == timerange['begin']['hour'] and minute >= timerange['begin']['minute']:
-            return True
-        elif hour < timerange['end']['hour']:
-            return True
-        elif hour == timerange['end']['hour'] and minute <= timerange['end']['minute']:
-            return True
-    else:
-        if hour > timerange['begin']['hour'] or (hour == timerange['begin']['hour'] and minute >= timerange['begin']['minute']):
-            if hour < timerange['end']['hour'] or (hour == timerange['end']['hour'] and minute <= timerange['end']['minute']):
-                return True
-
-    return False
-
-
-def datatime_is_sertain(dtm, time):
-    return (dtm.minute == time['minute'] and dtm.hour == time['hour'])
-
-
-def update_timers(now, conditions):
-    if 'minutes' in conditions:
-        conditions['range_timer'] = now + conditions['minutes']
-
-    return conditions
-
-
-def datetime_in_conditions(time, conditions): # Time means current time
-    if 'weekdays' in conditions and time.weekday() not in conditions['weekdays']:
-        return False
-    elif 'day' in conditions:
-        if time < conditions['day']:
-            return False
-
-    if 'schedule' in conditions:
-        for tm in conditions['schedule']:
-            if tm['type'] == 'range':
-                if datetime_in_timerange(time, tm):
-                    if 'range_timer' in conditions and time < conditions['range_timer']:
-                        print_if_debug(conditions['range_timer'] - time, "full")
-                        return 'range_timer'
-                    return True
-            elif tm['type'] == 'certain':
-                return datatime_is_sertain(time, tm)
-
-
-def update_conditions(now, conditions):
-    if 'range_timer' in conditions:
-        del conditions['range_timer']
-
-    if 'weekdays' in conditions:
-        return conditions
-
-    if now.day > conditions['day'].day:
-        conditions['day'] += conditions['every_days']
-
-    return conditions
-
-
 def to_hours(hour_string):
     return min(23, max(0, int(hour_string)))
 
@@ -135,7 +74,9 @@ def set_time_conditions(time_string):
             certain_time['minute'] = to_minutes(tm.split(':')[1])
             schedule.append(certain_time)
 
-    if time[1] != '*':
+    if time[1].endswith('s'):
+        conditions['minutes'] = timedelta(seconds=int(time[1][:-1]))
+    elif time[1] != '*':
         conditions['minutes'] = timedelta(minutes=int(time[1]))
 
     if time[2] == '*' and time[3] != '*':
@@ -151,9 +92,8 @@ def set_time_conditions(time_string):
     return conditions
 
 
-def prepare_object_to_sending(encoding, obj, split_data=False):
-    if split_data:
-        string = str(obj) + '\n'
-    else:
-        string = str(obj)
-    return string.replace("'", '"').encode(encoding)
+def encode_frame(encoding, obj):
+    """ cli protocol: every message is JSON prefixed by its length in bytes (4 bytes, big-endian) """
+    body = json.dumps(obj, ensure_ascii=False, default=str).encode(encoding)
+    return struct.pack('>I', len(body)) + body
+
@@ -1,33 +1,108 @@
+import threading
 
+from util import debug
 from api.prew_image import prevImage
-from models.uc_api.uc_api_models import LoginRequest
-from api.p2p_chat_method import AttachmentAPI
-from api.user_method import UserApi as uc_UserApi
 from constants import *
+from libs.net.http_client_async import UC_CLIENT, run_async
+
+
+class SessionExpiredError(RuntimeError):
+    pass
 
 
 def login(ip, port, user, password, debug):
     if debug:
         return None, None
 
-    new_user = LoginRequest(login=user, password=password)
-    response = uc_UserApi(data=new_user, ip=ip, port=port).login()
+    return run_async(UC_CLIENT.login(ip, port, user, password))
 
-    try:
-        return response.headers['protei-uc-sessionid'], int(response.data.payload['user_id'])
-    except:
-        raise RuntimeError(f'Cannot login to UC, smth wrong\n{response.headers} {response.status_code}')
 
+def check_session(response):
+    if response is not None and response.status_code in UC_SESSION_EXPIRED_CODES:
+        raise SessionExpiredError(f'UC session has expired, status code {response.status_code}')
 
-def upload_file(session_id, file_path, filename, ip, port, mediasize=None, attachment_id=None):
-    response = AttachmentAPI(cookie=session_id, ip=ip, port=port).upload_file(files=file_path, filename=filename,
-                                                            file_type=SCREENSHOTFILETYPE, mediasize=mediasize,
-                                                            attachment_id=attachment_id)
 
+def upload_file(session_id, file_path, filename, ip, port, mediasize=None, attachment_id=None, data=None,
+                file_type=SCREENSHOTFILETYPE):
+    """
+    Uploads file from file_path or from in-memory data (bytes, memoryview or file-like object) by async UC client,
+    data is streamed
+    """
+    file = open(file_path, 'rb') if data is None else None
     try:
-        attachment_id = response[0].headers["protei-uc-attachmentid"]
-        file_size = response[1]
+        response, file_size = run_async(UC_CLIENT.upload_file(ip, port, session_id, data if file is None else file, filename,
+                                                              file_type, mediasize=mediasize, attachment_id=attachment_id))
+    finally:
+        if file is not None:
+            file.close()
 
-        return attachment_id, file_size
+    check_session(response)
+
+    try:
+        return response.headers["protei-uc-attachmentid"], file_size
     except:
-        return None
\ No newline at end of file
+        return None
+
+
+class UcSessions:
+    """
+    UC sessions (protei-uc-sessionid, user_id) shared by all workers, keyed by (ip, port, user).
+    Login is done on first use and again only after session has expired.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.key_locks = {}
+
+
+    def key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+
+    def get(self, ip, port, user, password):
+        key = (ip, port, user)
+        with self.key_lock(key):
+            with self.lock:
+                if key in self.sessions:
+                    return self.sessions[key]
+
+            session = login(ip, port, user, password, debug=debug)
+
+            with self.lock:
+                self.sessions[key] = session
+            return session
+
+
+    def peek(self, ip, port, user):
+        with self.lock:
+            return self.sessions.get((ip, port, user))
+
+
+    def seed(self, ip, port, user, session):
+        if session is None:
+            return
+        with self.lock:
+            self.sessions[(ip, port, user)] = session
+
+
+    def invalidate(self, ip, port, user, session_id=None):
+        """ Forgets session, if session_id is given only when it is still the cached one """
+        with self.lock:
+            session = self.sessions.get((ip, port, user))
+            if session is not None and (session_id is None or session[0] == session_id):
+                del self.sessions[(ip, port, user)]
+
+
+    def run(self, ip, port, user, password, fn):
+        """ Calls fn(session_id, user_id), relogins and calls it once again if session has expired """
+        session_id, user_id = self.get(ip, port, user, password)
+        try:
+            return fn(session_id, user_id)
+        except SessionExpiredError:
+            self.invalidate(ip, port, user, session_id)
+            return fn(*self.get(ip, port, user, password))
+
+
+SESSIONS = UcSessions()